@@ -1,17 +1,131 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from pyrogram import Client
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
+from pyrogram import Client, enums, raw, types
+from pyrogram.errors import BadRequest, FileIdInvalid, FileReferenceExpired, FileReferenceInvalid, FloodWait, MediaEmpty, RPCError
+from pyrogram.methods.chats.get_chat_members import get_chunk as get_chat_members_chunk
+from functools import partial
+from urllib.parse import quote
+import base64
+import inspect
 import os
 
 app = FastAPI()
 
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import Optional
+from collections import deque
 import asyncio
+import json
+import time
+
+from client_pool import ClientPool, account_id
+from jobs import JobManager, advance_job
+from media_cache import MediaCache
+from metadata_cache import MetadataCache
+from metrics import HTTP_EXCEPTIONS, HTTP_LATENCY, HTTP_REQUESTS, registry, snapshot
+from pyro_client import UploadStream
+from pyrogram_service import PyrogramTriggerService
+from rate_limit import schedulers
+from serializers import FastJSONResponse, dumps, serializer
+from single_flight import SingleFlight
+from timing import Timings, current_timings
+
+# Session and client management: started clients are shared between requests
+tg_clients = ClientPool()
+# Webhook triggers: one listening client per account, shared by all of its triggers
+trigger_service = PyrogramTriggerService(tg_clients)
+# Chat metadata: get_chat / get_chat_member / get_chat_administrators, invalidated by updates
+metadata_cache = MetadataCache()
+metadata_cache.watch(tg_clients)
+# Identical reads running concurrently on one account share a single RPC
+reads = SingleFlight()
+
+
+@app.on_event("shutdown")
+async def shutdown_clients():
+    await trigger_service.stop()
+    await tg_clients.close()
+
+
+@app.exception_handler(FloodWait)
+async def flood_wait_handler(request: Request, exc: FloodWait):
+    """FloodWait longer than the scheduler is allowed to sleep: tell the caller when to retry"""
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(exc.value)},
+        content={"error": str(exc), "retry_after": exc.value}
+    )
+
+
+# Upload dedup: media sent before on the same account is re-sent by file_id
+media_cache = MediaCache()
+STALE_FILE_ID_ERRORS = (FileIdInvalid, FileReferenceExpired, FileReferenceInvalid, MediaEmpty)
+
+def remember_media(account: str, field: str, digest: Optional[str], msg):
+    if digest is None:
+        return
+    # Only the attribute matching the send call: file_ids of other kinds are rejected by it
+    media = getattr(msg, field, None)
+    if media is not None:
+        media_cache.put(account, field, digest, media.file_id)
+
+async def send_with_media_cache(req, field: str, media, send, digest: Optional[str] = None):
+    """Call ``send(**{field: media})``, substituting the file_id this account got for the same media earlier"""
+    account = account_id(req)
+    digest = digest or await media_cache.digest(media)
+    if digest is not None:
+        file_id = media_cache.get(account, field, digest)
+        if file_id is not None:
+            try:
+                return await send(**{field: file_id})
+            except STALE_FILE_ID_ERRORS:
+                media_cache.discard(account, field, digest)
+    msg = await send(**{field: media})
+    if isinstance(media, UploadStream):
+        # Remember streamed bodies under the hash of what was actually received
+        digest = "sha256:" + media.sha256.hexdigest()
+    remember_media(account, field, digest, msg)
+    return msg
+
+
+# Streaming (NDJSON) responses for long listings
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def wants_stream(req, request: Optional[Request]) -> bool:
+    """Stream when the request sets stream=true or accepts application/x-ndjson"""
+    if getattr(req, "stream", False):
+        return True
+    return request is not None and NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def stream_ndjson(req, rows):
+    """Stream rows produced by ``rows(client)`` one JSON line at a time while holding a pool lease"""
+    async def lines():
+        try:
+            async with tg_clients.lease(req) as client:
+                async for row in rows(client):
+                    yield dumps(row) + b"\n"
+        except Exception as e:
+            yield dumps({"error": str(e)}) + b"\n"
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+# Opaque pagination cursors
+def encode_cursor(kind: str, **state) -> str:
+    payload = json.dumps({"kind": kind, **state}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str, kind: str) -> dict:
+    """Decode a cursor returned by encode_cursor, raising ValueError if it is malformed or of another kind"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict) or state.pop("kind", None) != kind:
+        raise ValueError("Invalid cursor")
+    return state
 
-# Session and client management
-tg_clients = {}
 
 class AuthRequest(BaseModel):
     api_id: int
@@ -43,14 +157,10 @@ async def auth(req: AuthRequest):
         # Already have session string, just return it
         return {"session_string": req.session_string}
     if req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
+        async with tg_clients.lease(req) as client:
+            session_string = await client.export_session_string()
     elif req.phone_number:
+        # Interactive login can't be pooled: the throwaway client only exists to export its session
         client = Client(
             name="user",
             api_id=req.api_id,
@@ -58,12 +168,11 @@ async def auth(req: AuthRequest):
             phone_number=req.phone_number,
             in_memory=True
         )
+        await client.start()
+        session_string = await client.export_session_string()
+        await client.stop()
     else:
         return {"error": "Provide either session_string, bot_token, or phone_number"}
-
-    await client.start()
-    session_string = await client.export_session_string()
-    await client.stop()
     return {"session_string": session_string}
 
 
@@ -71,33 +180,16 @@ async def auth(req: AuthRequest):
 @app.post("/send_message")
 async def send_message(req: SendMessageRequest):
     # Use session string or bot token
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_message(
-        chat_id=req.chat_id,
-        text=req.text,
-        parse_mode=req.parse_mode if req.parse_mode else None,
-        disable_notification=req.disable_notification
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.send_message(
+            chat_id=req.chat_id,
+            text=req.text,
+            parse_mode=req.parse_mode if req.parse_mode else None,
+            disable_notification=req.disable_notification
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 # TODO: Реалізувати endpoint-и для всіх основних Pyrogram-операцій згідно ТЗ:
@@ -123,34 +215,17 @@ class SendPhotoRequest(BaseModel):
 
 @app.post("/send_photo")
 async def send_photo(req: SendPhotoRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_photo(
-        chat_id=req.chat_id,
-        photo=req.photo,
-        caption=req.caption,
-        parse_mode=req.parse_mode,
-        ttl_seconds=req.ttl_seconds
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await send_with_media_cache(req, "photo", req.photo, partial(
+            client.send_photo,
+            chat_id=req.chat_id,
+            caption=req.caption,
+            parse_mode=req.parse_mode,
+            ttl_seconds=req.ttl_seconds
+        ))
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendVideoRequest(BaseModel):
@@ -169,37 +244,20 @@ class SendVideoRequest(BaseModel):
 
 @app.post("/send_video")
 async def send_video(req: SendVideoRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_video(
-        chat_id=req.chat_id,
-        video=req.video,
-        caption=req.caption,
-        duration=req.duration,
-        width=req.width,
-        height=req.height,
-        thumb=req.thumb,
-        supports_streaming=req.supports_streaming
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await send_with_media_cache(req, "video", req.video, partial(
+            client.send_video,
+            chat_id=req.chat_id,
+            caption=req.caption,
+            duration=req.duration,
+            width=req.width,
+            height=req.height,
+            thumb=req.thumb,
+            supports_streaming=req.supports_streaming
+        ))
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendAudioRequest(BaseModel):
@@ -216,35 +274,18 @@ class SendAudioRequest(BaseModel):
 
 @app.post("/send_audio")
 async def send_audio(req: SendAudioRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_audio(
-        chat_id=req.chat_id,
-        audio=req.audio,
-        caption=req.caption,
-        duration=req.duration,
-        performer=req.performer,
-        title=req.title
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await send_with_media_cache(req, "audio", req.audio, partial(
+            client.send_audio,
+            chat_id=req.chat_id,
+            caption=req.caption,
+            duration=req.duration,
+            performer=req.performer,
+            title=req.title
+        ))
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendDocumentRequest(BaseModel):
@@ -260,34 +301,17 @@ class SendDocumentRequest(BaseModel):
 
 @app.post("/send_document")
 async def send_document(req: SendDocumentRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_document(
-        chat_id=req.chat_id,
-        document=req.document,
-        caption=req.caption,
-        parse_mode=req.parse_mode,
-        file_name=req.file_name
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await send_with_media_cache(req, "document", req.document, partial(
+            client.send_document,
+            chat_id=req.chat_id,
+            caption=req.caption,
+            parse_mode=req.parse_mode,
+            file_name=req.file_name
+        ))
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendVoiceRequest(BaseModel):
@@ -302,33 +326,16 @@ class SendVoiceRequest(BaseModel):
 
 @app.post("/send_voice")
 async def send_voice(req: SendVoiceRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_voice(
-        chat_id=req.chat_id,
-        voice=req.voice,
-        caption=req.caption,
-        duration=req.duration
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await send_with_media_cache(req, "voice", req.voice, partial(
+            client.send_voice,
+            chat_id=req.chat_id,
+            caption=req.caption,
+            duration=req.duration
+        ))
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendVideoNoteRequest(BaseModel):
@@ -344,34 +351,17 @@ class SendVideoNoteRequest(BaseModel):
 
 @app.post("/send_video_note")
 async def send_video_note(req: SendVideoNoteRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_video_note(
-        chat_id=req.chat_id,
-        video_note=req.video_note,
-        duration=req.duration,
-        length=req.length,
-        thumb=req.thumb
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await send_with_media_cache(req, "video_note", req.video_note, partial(
+            client.send_video_note,
+            chat_id=req.chat_id,
+            duration=req.duration,
+            length=req.length,
+            thumb=req.thumb
+        ))
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendAnimationRequest(BaseModel):
@@ -388,35 +378,18 @@ class SendAnimationRequest(BaseModel):
 
 @app.post("/send_animation")
 async def send_animation(req: SendAnimationRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_animation(
-        chat_id=req.chat_id,
-        animation=req.animation,
-        caption=req.caption,
-        duration=req.duration,
-        width=req.width,
-        height=req.height
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await send_with_media_cache(req, "animation", req.animation, partial(
+            client.send_animation,
+            chat_id=req.chat_id,
+            caption=req.caption,
+            duration=req.duration,
+            width=req.width,
+            height=req.height
+        ))
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendStickerRequest(BaseModel):
@@ -431,33 +404,16 @@ class SendStickerRequest(BaseModel):
 
 @app.post("/send_sticker")
 async def send_sticker(req: SendStickerRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_sticker(
-        chat_id=req.chat_id,
-        sticker=req.sticker,
-        emoji=req.emoji,
-        disable_notification=req.disable_notification
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await send_with_media_cache(req, "sticker", req.sticker, partial(
+            client.send_sticker,
+            chat_id=req.chat_id,
+            emoji=req.emoji,
+            disable_notification=req.disable_notification
+        ))
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendLocationRequest(BaseModel):
@@ -474,35 +430,18 @@ class SendLocationRequest(BaseModel):
 
 @app.post("/send_location")
 async def send_location(req: SendLocationRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_location(
-        chat_id=req.chat_id,
-        latitude=req.latitude,
-        longitude=req.longitude,
-        live_period=req.live_period,
-        heading=req.heading,
-        proximity_alert_radius=req.proximity_alert_radius
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.send_location(
+            chat_id=req.chat_id,
+            latitude=req.latitude,
+            longitude=req.longitude,
+            live_period=req.live_period,
+            heading=req.heading,
+            proximity_alert_radius=req.proximity_alert_radius
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendVenueRequest(BaseModel):
@@ -522,38 +461,21 @@ class SendVenueRequest(BaseModel):
 
 @app.post("/send_venue")
 async def send_venue(req: SendVenueRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_venue(
-        chat_id=req.chat_id,
-        latitude=req.latitude,
-        longitude=req.longitude,
-        title=req.title,
-        address=req.address,
-        foursquare_id=req.foursquare_id,
-        foursquare_type=req.foursquare_type,
-        google_place_id=req.google_place_id,
-        google_place_type=req.google_place_type
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.send_venue(
+            chat_id=req.chat_id,
+            latitude=req.latitude,
+            longitude=req.longitude,
+            title=req.title,
+            address=req.address,
+            foursquare_id=req.foursquare_id,
+            foursquare_type=req.foursquare_type,
+            google_place_id=req.google_place_id,
+            google_place_type=req.google_place_type
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendContactRequest(BaseModel):
@@ -569,34 +491,17 @@ class SendContactRequest(BaseModel):
 
 @app.post("/send_contact")
 async def send_contact(req: SendContactRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_contact(
-        chat_id=req.chat_id,
-        phone_number=req.phone_number,
-        first_name=req.first_name,
-        last_name=req.last_name,
-        vcard=req.vcard
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.send_contact(
+            chat_id=req.chat_id,
+            phone_number=req.phone_number,
+            first_name=req.first_name,
+            last_name=req.last_name,
+            vcard=req.vcard
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendPollRequest(BaseModel):
@@ -618,40 +523,23 @@ class SendPollRequest(BaseModel):
 
 @app.post("/send_poll")
 async def send_poll(req: SendPollRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_poll(
-        chat_id=req.chat_id,
-        question=req.question,
-        options=req.options,
-        is_anonymous=req.is_anonymous,
-        type=req.type,
-        allows_multiple_answers=req.allows_multiple_answers,
-        correct_option_id=req.correct_option_id,
-        explanation=req.explanation,
-        open_period=req.open_period,
-        close_date=req.close_date,
-        is_closed=req.is_closed
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.send_poll(
+            chat_id=req.chat_id,
+            question=req.question,
+            options=req.options,
+            is_anonymous=req.is_anonymous,
+            type=req.type,
+            allows_multiple_answers=req.allows_multiple_answers,
+            correct_option_id=req.correct_option_id,
+            explanation=req.explanation,
+            open_period=req.open_period,
+            close_date=req.close_date,
+            is_closed=req.is_closed
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class SendDiceRequest(BaseModel):
@@ -664,31 +552,14 @@ class SendDiceRequest(BaseModel):
 
 @app.post("/send_dice")
 async def send_dice(req: SendDiceRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.send_dice(
-        chat_id=req.chat_id,
-        emoji=req.emoji
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.send_dice(
+            chat_id=req.chat_id,
+            emoji=req.emoji
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date, "value": msg.dice.value if msg.dice else None}
 
 class ForwardMessageRequest(BaseModel):
@@ -703,33 +574,16 @@ class ForwardMessageRequest(BaseModel):
 
 @app.post("/forward_message")
 async def forward_message(req: ForwardMessageRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.forward_messages(
-        chat_id=req.chat_id,
-        from_chat_id=req.from_chat_id,
-        message_ids=[req.message_id],
-        disable_notification=req.disable_notification
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.forward_messages(
+            chat_id=req.chat_id,
+            from_chat_id=req.from_chat_id,
+            message_ids=[req.message_id],
+            disable_notification=req.disable_notification
+        )
     return {"message_id": msg[0].id if msg else None, "chat_id": msg[0].chat.id if msg else None, "date": msg[0].date if msg else None}
 
 class CopyMessageRequest(BaseModel):
@@ -746,35 +600,18 @@ class CopyMessageRequest(BaseModel):
 
 @app.post("/copy_message")
 async def copy_message(req: CopyMessageRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.copy_message(
-        chat_id=req.chat_id,
-        from_chat_id=req.from_chat_id,
-        message_id=req.message_id,
-        caption=req.caption,
-        parse_mode=req.parse_mode,
-        disable_notification=req.disable_notification
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.copy_message(
+            chat_id=req.chat_id,
+            from_chat_id=req.from_chat_id,
+            message_id=req.message_id,
+            caption=req.caption,
+            parse_mode=req.parse_mode,
+            disable_notification=req.disable_notification
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class EditMessageTextRequest(BaseModel):
@@ -789,33 +626,16 @@ class EditMessageTextRequest(BaseModel):
 
 @app.post("/edit_message_text")
 async def edit_message_text(req: EditMessageTextRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
+    if not (req.session_string or req.bot_token):
+        return {"error": "Provide session_string or bot_token"}
+
+    async with tg_clients.lease(req) as client:
+        msg = await client.edit_message_text(
+            chat_id=req.chat_id,
+            message_id=req.message_id,
+            text=req.text,
+            parse_mode=req.parse_mode
         )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
-        return {"error": "Provide session_string or bot_token"}
-
-    await client.start()
-    msg = await client.edit_message_text(
-        chat_id=req.chat_id,
-        message_id=req.message_id,
-        text=req.text,
-        parse_mode=req.parse_mode
-    )
-    await client.stop()
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class EditMessageCaptionRequest(BaseModel):
@@ -830,33 +650,16 @@ class EditMessageCaptionRequest(BaseModel):
 
 @app.post("/edit_message_caption")
 async def edit_message_caption(req: EditMessageCaptionRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.edit_message_caption(
-        chat_id=req.chat_id,
-        message_id=req.message_id,
-        caption=req.caption,
-        parse_mode=req.parse_mode
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.edit_message_caption(
+            chat_id=req.chat_id,
+            message_id=req.message_id,
+            caption=req.caption,
+            parse_mode=req.parse_mode
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class EditMessageMediaRequest(BaseModel):
@@ -874,39 +677,21 @@ class EditMessageMediaRequest(BaseModel):
 @app.post("/edit_message_media")
 async def edit_message_media(req: EditMessageMediaRequest):
     from pyrogram.types import InputMediaPhoto, InputMediaVideo
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    if req.media_type == 'photo':
-        media = InputMediaPhoto(media=req.media, caption=req.caption, parse_mode=req.parse_mode)
-    elif req.media_type == 'video':
-        media = InputMediaVideo(media=req.media, caption=req.caption, parse_mode=req.parse_mode)
-    else:
-        await client.stop()
-        return {"error": "Unsupported media_type"}
-    msg = await client.edit_message_media(
-        chat_id=req.chat_id,
-        message_id=req.message_id,
-        media=media
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        if req.media_type == 'photo':
+            media = InputMediaPhoto(media=req.media, caption=req.caption, parse_mode=req.parse_mode)
+        elif req.media_type == 'video':
+            media = InputMediaVideo(media=req.media, caption=req.caption, parse_mode=req.parse_mode)
+        else:
+            return {"error": "Unsupported media_type"}
+        msg = await client.edit_message_media(
+            chat_id=req.chat_id,
+            message_id=req.message_id,
+            media=media
+        )
     return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
 
 class DeleteMessageRequest(BaseModel):
@@ -919,31 +704,14 @@ class DeleteMessageRequest(BaseModel):
 
 @app.post("/delete_message")
 async def delete_message(req: DeleteMessageRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    result = await client.delete_messages(
-        chat_id=req.chat_id,
-        message_ids=[req.message_id]
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        result = await client.delete_messages(
+            chat_id=req.chat_id,
+            message_ids=[req.message_id]
+        )
     return {"result": result}
 
 class GetMessagesRequest(BaseModel):
@@ -953,35 +721,27 @@ class GetMessagesRequest(BaseModel):
     bot_token: Optional[str] = None
     chat_id: int
     message_ids: list[int]
+    fields: Optional[list[str] | str] = None
 
 @app.post("/get_messages")
 async def get_messages(req: GetMessagesRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
+    try:
+        # Without fields the messages stay plain texts, as before projections existed
+        serialize = serializer("message", req.fields) if req.fields else None
+    except ValueError as e:
+        return {"error": str(e)}
 
-    await client.start()
-    msgs = await client.get_messages(
-        chat_id=req.chat_id,
-        message_ids=req.message_ids
-    )
-    await client.stop()
-    return {"messages": [msg.text if hasattr(msg, 'text') else None for msg in (msgs if isinstance(msgs, list) else [msgs]) ]}
+    async with tg_clients.lease(req) as client:
+        msgs = await client.get_messages(
+            chat_id=req.chat_id,
+            message_ids=req.message_ids
+        )
+    msgs = msgs if isinstance(msgs, list) else [msgs]
+    if serialize is None:
+        return {"messages": [msg.text if hasattr(msg, 'text') else None for msg in msgs]}
+    return FastJSONResponse({"messages": [serialize(msg) for msg in msgs]})
 
 class GetMessageHistoryRequest(BaseModel):
     api_id: int
@@ -991,38 +751,49 @@ class GetMessageHistoryRequest(BaseModel):
     chat_id: int
     limit: Optional[int] = 10
     offset_id: Optional[int] = 0
+    cursor: Optional[str] = None
+    stream: Optional[bool] = False
+    fields: Optional[list[str] | str] = None
 
 @app.post("/get_message_history")
-async def get_message_history(req: GetMessageHistoryRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+async def get_message_history(req: GetMessageHistoryRequest, request: Request = None):
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
+    try:
+        serialize = serializer("message", req.fields)
+    except ValueError as e:
+        return {"error": str(e)}
 
-    await client.start()
-    msgs = []
-    async for msg in client.get_chat_history(
-        chat_id=req.chat_id,
-        limit=req.limit,
-        offset_id=req.offset_id
-    ):
-        msgs.append({"id": msg.id, "text": getattr(msg, 'text', None), "date": msg.date})
-    await client.stop()
-    return {"messages": msgs}
+    offset_id = req.offset_id
+    if req.cursor:
+        try:
+            offset_id = decode_cursor(req.cursor, "history")["offset_id"]
+        except (ValueError, KeyError):
+            return {"error": "Invalid cursor"}
+
+    oldest_id = None
+
+    async def rows(client):
+        nonlocal oldest_id
+        async for msg in client.get_chat_history(
+            chat_id=req.chat_id,
+            limit=req.limit,
+            offset_id=offset_id
+        ):
+            advance_job()
+            oldest_id = msg.id
+            yield serialize(msg)
+
+    if wants_stream(req, request):
+        return stream_ndjson(req, rows)
+
+    async with tg_clients.lease(req) as client:
+        msgs = [row async for row in rows(client)]
+    # History is newest first: the next page starts below the oldest message returned
+    next_cursor = None
+    if req.limit and len(msgs) == req.limit:
+        next_cursor = encode_cursor("history", offset_id=oldest_id)
+    return FastJSONResponse({"messages": msgs, "next_cursor": next_cursor})
 
 class SearchMessagesRequest(BaseModel):
     api_id: int
@@ -1032,38 +803,46 @@ class SearchMessagesRequest(BaseModel):
     chat_id: int
     query: str
     limit: Optional[int] = 10
+    offset: Optional[int] = 0
+    cursor: Optional[str] = None
+    stream: Optional[bool] = False
+    fields: Optional[list[str] | str] = None
 
 @app.post("/search_messages")
-async def search_messages(req: SearchMessagesRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+async def search_messages(req: SearchMessagesRequest, request: Request = None):
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
+    try:
+        serialize = serializer("message", req.fields)
+    except ValueError as e:
+        return {"error": str(e)}
 
-    await client.start()
-    msgs = []
-    async for msg in client.search_messages(
-        chat_id=req.chat_id,
-        query=req.query,
-        limit=req.limit
-    ):
-        msgs.append({"id": msg.id, "text": getattr(msg, 'text', None), "date": msg.date})
-    await client.stop()
-    return {"messages": msgs}
+    offset = req.offset
+    if req.cursor:
+        try:
+            offset = decode_cursor(req.cursor, "search")["offset"]
+        except (ValueError, KeyError):
+            return {"error": "Invalid cursor"}
+
+    async def rows(client):
+        async for msg in client.search_messages(
+            chat_id=req.chat_id,
+            query=req.query,
+            offset=offset,
+            limit=req.limit
+        ):
+            advance_job()
+            yield serialize(msg)
+
+    if wants_stream(req, request):
+        return stream_ndjson(req, rows)
+
+    async with tg_clients.lease(req) as client:
+        msgs = [row async for row in rows(client)]
+    next_cursor = None
+    if req.limit and len(msgs) == req.limit:
+        next_cursor = encode_cursor("search", offset=offset + len(msgs))
+    return FastJSONResponse({"messages": msgs, "next_cursor": next_cursor})
 
 class DownloadMediaRequest(BaseModel):
     api_id: int
@@ -1073,40 +852,147 @@ class DownloadMediaRequest(BaseModel):
     chat_id: int
     message_id: int
     file_name: Optional[str] = None
+    stream: Optional[bool] = False
+    parallel: Optional[int] = None
+
+# Telegram serves files in 1 MB chunks; parallel downloads fetch segments of several chunks each
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_SEGMENT_CHUNKS = int(os.environ.get("PYRO_DOWNLOAD_SEGMENT_CHUNKS", "4"))
+DOWNLOAD_PARALLEL = int(os.environ.get("PYRO_DOWNLOAD_PARALLEL", "4"))
+DOWNLOAD_MAX_PARALLEL = int(os.environ.get("PYRO_DOWNLOAD_MAX_PARALLEL", "8"))
+
+MEDIA_KINDS = ("audio", "document", "photo", "sticker", "animation", "video", "voice", "video_note")
+
+def find_media(msg):
+    """Return (kind, media) for the downloadable media of a message, or (None, None)"""
+    for kind in MEDIA_KINDS:
+        media = getattr(msg, kind, None)
+        if media is not None:
+            return kind, media
+    return None, None
+
+def media_headers(msg, kind, media, file_name: Optional[str] = None) -> dict:
+    file_name = file_name or getattr(media, "file_name", None) or f"{kind}_{msg.id}"
+    headers = {
+        "Content-Type": getattr(media, "mime_type", None) or ("image/jpeg" if kind == "photo" else "application/octet-stream"),
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(file_name)}",
+    }
+    if getattr(media, "file_size", 0):
+        headers["Content-Length"] = str(media.file_size)
+    return headers
+
+def parse_range(header: Optional[str], size: int):
+    """Parse a single-range ``Range: bytes=...`` header into inclusive (start, end).
+
+    Returns None when there is no usable range (the whole file is served) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not size or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+async def fetch_media_segment(client, msg, offset: int, limit: int) -> list:
+    return [chunk async for chunk in client.stream_media(msg, limit=limit, offset=offset)]
+
+async def iter_media_chunks(client, msg, first: int, last: int, parallel: int):
+    """Yield chunks ``first``..``last`` of the media in order, keeping up to ``parallel`` segments in flight"""
+    if parallel <= 1:
+        async for chunk in client.stream_media(msg, limit=last - first + 1, offset=first):
+            yield chunk
+        return
+
+    segments = iter(range(first, last + 1, DOWNLOAD_SEGMENT_CHUNKS))
+    pending = deque()
+
+    def schedule():
+        for offset in segments:
+            limit = min(DOWNLOAD_SEGMENT_CHUNKS, last + 1 - offset)
+            pending.append(asyncio.ensure_future(fetch_media_segment(client, msg, offset, limit)))
+            return
+
+    try:
+        for _ in range(parallel):
+            schedule()
+        while pending:
+            segment = await pending.popleft()
+            schedule()
+            for chunk in segment:
+                yield chunk
+    finally:
+        for task in pending:
+            task.cancel()
+
+def stream_media_response(req, msg, headers: dict, byte_range=None, parallel: int = 1):
+    """Stream the media of ``msg`` (or the inclusive ``byte_range`` of it) straight from Telegram"""
+    size = int(headers.get("Content-Length", 0))
+    start, stop = byte_range or (0, size - 1)
+    status_code = 200
+    if byte_range is not None:
+        status_code = 206
+        headers = {**headers, "Content-Length": str(stop - start + 1), "Content-Range": f"bytes {start}-{stop}/{size}"}
+
+    async def chunks():
+        async with tg_clients.lease(req) as client:
+            if byte_range is None and parallel <= 1:
+                async for chunk in client.stream_media(msg):
+                    yield chunk
+                return
+            position = start - start % DOWNLOAD_CHUNK_SIZE
+            async for chunk in iter_media_chunks(
+                client, msg, start // DOWNLOAD_CHUNK_SIZE, stop // DOWNLOAD_CHUNK_SIZE, parallel
+            ):
+                # Trim the first and last chunks to the requested byte range
+                low, high = max(start - position, 0), min(stop + 1 - position, len(chunk))
+                position += len(chunk)
+                if low < high:
+                    yield chunk[low:high] if (low, high) != (0, len(chunk)) else chunk
+
+    return StreamingResponse(chunks(), status_code=status_code, headers={**headers, "Accept-Ranges": "bytes"})
 
 @app.post("/download_media")
-async def download_media(req: DownloadMediaRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+async def download_media(req: DownloadMediaRequest, request: Request = None):
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    msg = await client.get_messages(
-        chat_id=req.chat_id,
-        message_ids=[req.message_id]
-    )
-    if isinstance(msg, list):
-        msg = msg[0]
-    file_path = await client.download_media(
-        message=msg,
-        file_name=req.file_name
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        msg = await client.get_messages(
+            chat_id=req.chat_id,
+            message_ids=[req.message_id]
+        )
+        if isinstance(msg, list):
+            msg = msg[0]
+        if req.stream:
+            kind, media = find_media(msg)
+            if media is None:
+                return {"error": "Message has no downloadable media"}
+            headers = media_headers(msg, kind, media, req.file_name)
+            size = int(headers.get("Content-Length", 0))
+            try:
+                byte_range = parse_range(request.headers.get("range") if request else None, size)
+            except ValueError:
+                return JSONResponse(
+                    status_code=416,
+                    headers={"Content-Range": f"bytes */{size}"},
+                    content={"error": "Range not satisfiable"}
+                )
+            # Parallel segment fetching needs the file size to know where to stop
+            parallel = min(max(req.parallel or DOWNLOAD_PARALLEL, 1), DOWNLOAD_MAX_PARALLEL) if size else 1
+            return stream_media_response(req, msg, headers, byte_range, parallel)
+        file_path = await client.download_media(
+            message=msg,
+            file_name=req.file_name
+        )
     return {"file_path": file_path}
 
 class GetChatRequest(BaseModel):
@@ -1115,32 +1001,19 @@ class GetChatRequest(BaseModel):
     session_string: Optional[str] = None
     bot_token: Optional[str] = None
     chat_id: int
+    fresh: Optional[bool] = False
 
 @app.post("/get_chat")
 async def get_chat(req: GetChatRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    chat = await client.get_chat(req.chat_id)
-    await client.stop()
-    return {"id": chat.id, "title": getattr(chat, 'title', None), "type": chat.type, "username": getattr(chat, 'username', None)}
+    async def load():
+        async with tg_clients.lease(req) as client:
+            chat = await client.get_chat(req.chat_id)
+        return {"id": chat.id, "title": getattr(chat, 'title', None), "type": chat.type, "username": getattr(chat, 'username', None)}
+    key = (account_id(req), req.chat_id, "chat")
+    return await metadata_cache.fetch(key, partial(reads.do, key, load), fresh=req.fresh)
 
 class GetChatMembersRequest(BaseModel):
     api_id: int
@@ -1150,34 +1023,64 @@ class GetChatMembersRequest(BaseModel):
     chat_id: int
     limit: Optional[int] = 10
     offset: Optional[int] = 0
+    cursor: Optional[str] = None
+    fields: Optional[list[str] | str] = None
+
+async def iter_chat_members(client, chat_id, limit: int, offset: int = 0):
+    """Like client.get_chat_members, but starting at ``offset`` without re-fetching the skipped members"""
+    peer = await client.resolve_peer(chat_id)
+    if isinstance(peer, raw.types.InputPeerChat):
+        # Basic groups return all members in one call, so there is nothing to page over
+        index = 0
+        async for member in client.get_chat_members(chat_id):
+            if index >= offset:
+                yield member
+            index += 1
+            if limit and index >= offset + limit:
+                return
+        return
+
+    remaining = limit or (1 << 31) - 1
+    while remaining > 0:
+        members = await get_chat_members_chunk(
+            client=client,
+            chat_id=chat_id,
+            offset=offset,
+            filter=enums.ChatMembersFilter.SEARCH,
+            limit=min(200, remaining),
+            query=""
+        )
+        if not members:
+            return
+        for member in members[:remaining]:
+            yield member
+        offset += len(members)
+        remaining -= len(members)
 
 @app.post("/get_chat_members")
 async def get_chat_members(req: GetChatMembersRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
+    try:
+        serialize = serializer("member", req.fields)
+    except ValueError as e:
+        return {"error": str(e)}
 
-    await client.start()
-    members = []
-    async for member in client.get_chat_members(req.chat_id, limit=req.limit, offset=req.offset):
-        members.append({"user_id": member.user.id, "status": member.status, "username": getattr(member.user, 'username', None)})
-    await client.stop()
-    return {"members": members}
+    offset = req.offset
+    if req.cursor:
+        try:
+            offset = decode_cursor(req.cursor, "members")["offset"]
+        except (ValueError, KeyError):
+            return {"error": "Invalid cursor"}
+
+    async with tg_clients.lease(req) as client:
+        members = []
+        async for member in iter_chat_members(client, req.chat_id, limit=req.limit, offset=offset):
+            members.append(serialize(member))
+    next_cursor = None
+    if req.limit and len(members) == req.limit:
+        next_cursor = encode_cursor("members", offset=offset + len(members))
+    return FastJSONResponse({"members": members, "next_cursor": next_cursor})
 
 class GetChatMemberRequest(BaseModel):
     api_id: int
@@ -1186,32 +1089,19 @@ class GetChatMemberRequest(BaseModel):
     bot_token: Optional[str] = None
     chat_id: int
     user_id: int
+    fresh: Optional[bool] = False
 
 @app.post("/get_chat_member")
 async def get_chat_member(req: GetChatMemberRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    member = await client.get_chat_member(req.chat_id, req.user_id)
-    await client.stop()
-    return {"user_id": member.user.id, "status": member.status, "username": getattr(member.user, 'username', None)}
+    async def load():
+        async with tg_clients.lease(req) as client:
+            member = await client.get_chat_member(req.chat_id, req.user_id)
+        return {"user_id": member.user.id, "status": member.status, "username": getattr(member.user, 'username', None)}
+    key = (account_id(req), req.chat_id, "member", req.user_id)
+    return await metadata_cache.fetch(key, partial(reads.do, key, load), fresh=req.fresh)
 
 class GetChatAdministratorsRequest(BaseModel):
     api_id: int
@@ -1219,35 +1109,21 @@ class GetChatAdministratorsRequest(BaseModel):
     session_string: Optional[str] = None
     bot_token: Optional[str] = None
     chat_id: int
+    fresh: Optional[bool] = False
 
 @app.post("/get_chat_administrators")
 async def get_chat_administrators(req: GetChatAdministratorsRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    admins = await client.get_chat_members(req.chat_id, filter="administrators")
-    result = []
-    async for admin in admins:
-        result.append({"user_id": admin.user.id, "status": admin.status, "username": getattr(admin.user, 'username', None)})
-    await client.stop()
-    return {"administrators": result}
+    async def load():
+        async with tg_clients.lease(req) as client:
+            result = []
+            async for admin in client.get_chat_members(req.chat_id, filter=enums.ChatMembersFilter.ADMINISTRATORS):
+                result.append({"user_id": admin.user.id, "status": admin.status, "username": getattr(admin.user, 'username', None)})
+        return {"administrators": result}
+    key = (account_id(req), req.chat_id, "administrators")
+    return await metadata_cache.fetch(key, partial(reads.do, key, load), fresh=req.fresh)
 
 class LeaveChatRequest(BaseModel):
     api_id: int
@@ -1258,28 +1134,12 @@ class LeaveChatRequest(BaseModel):
 
 @app.post("/leave_chat")
 async def leave_chat(req: LeaveChatRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    result = await client.leave_chat(req.chat_id)
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        result = await client.leave_chat(req.chat_id)
+    metadata_cache.invalidate(account_id(req), req.chat_id)
     return {"result": result}
 
 class SetChatTitleRequest(BaseModel):
@@ -1292,28 +1152,12 @@ class SetChatTitleRequest(BaseModel):
 
 @app.post("/set_chat_title")
 async def set_chat_title(req: SetChatTitleRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    result = await client.set_chat_title(req.chat_id, req.title)
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        result = await client.set_chat_title(req.chat_id, req.title)
+    metadata_cache.invalidate(account_id(req), req.chat_id)
     return {"result": result}
 
 class SetChatPhotoRequest(BaseModel):
@@ -1326,28 +1170,12 @@ class SetChatPhotoRequest(BaseModel):
 
 @app.post("/set_chat_photo")
 async def set_chat_photo(req: SetChatPhotoRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    result = await client.set_chat_photo(req.chat_id, req.photo)
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        result = await client.set_chat_photo(req.chat_id, req.photo)
+    metadata_cache.invalidate(account_id(req), req.chat_id)
     return {"result": result}
 
 class DeleteChatPhotoRequest(BaseModel):
@@ -1359,28 +1187,12 @@ class DeleteChatPhotoRequest(BaseModel):
 
 @app.post("/delete_chat_photo")
 async def delete_chat_photo(req: DeleteChatPhotoRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    result = await client.delete_chat_photo(req.chat_id)
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        result = await client.delete_chat_photo(req.chat_id)
+    metadata_cache.invalidate(account_id(req), req.chat_id)
     return {"result": result}
 
 class GetMeRequest(BaseModel):
@@ -1391,28 +1203,13 @@ class GetMeRequest(BaseModel):
 
 @app.post("/get_me")
 async def get_me(req: GetMeRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    me = await client.get_me()
-    await client.stop()
+    async def load():
+        async with tg_clients.lease(req) as client:
+            return await client.get_me()
+    me = await reads.do((account_id(req), "me"), load)
     return {"id": me.id, "is_bot": me.is_bot, "first_name": me.first_name, "username": getattr(me, 'username', None)}
 
 class GetUsersRequest(BaseModel):
@@ -1421,32 +1218,82 @@ class GetUsersRequest(BaseModel):
     session_string: Optional[str] = None
     bot_token: Optional[str] = None
     user_ids: list[int]
+    fields: Optional[list[str] | str] = None
+
+# Bulk user lookup: ids are fetched in Telegram-sized chunks, several chunks at a time
+USERS_CHUNK = int(os.environ.get("PYRO_USERS_CHUNK", "200"))
+USERS_CONCURRENCY = int(os.environ.get("PYRO_USERS_CONCURRENCY", "4"))
+
+async def input_user(client, user_id: int):
+    """InputUser from the session's peer cache; unknown ids are tried with access_hash 0, as Pyrogram does"""
+    if user_id <= 0:
+        raise ValueError("Not a user id")
+    try:
+        peer = await client.storage.get_peer_by_id(user_id)
+    except KeyError:
+        return raw.types.InputUser(user_id=user_id, access_hash=0)
+    if not isinstance(peer, raw.types.InputPeerUser):
+        raise ValueError("Not a user id")
+    return raw.types.InputUser(user_id=peer.user_id, access_hash=peer.access_hash)
+
+async def fetch_users(client, inputs: dict) -> dict:
+    """user_id -> User, or an error message, for one chunk of {user_id: InputUser}"""
+    try:
+        result = await client.invoke(raw.functions.users.GetUsers(id=list(inputs.values())))
+    except BadRequest as e:
+        # PeerIdInvalid, UserIdInvalid and the like: a single bad id fails the
+        # whole chunk, so split it to isolate the culprit
+        if len(inputs) == 1:
+            return {user_id: str(e) for user_id in inputs}
+        items = list(inputs.items())
+        half = len(items) // 2
+        return {**await fetch_users(client, dict(items[:half])), **await fetch_users(client, dict(items[half:]))}
+    except RPCError as e:
+        # FloodWait longer than the scheduler sits out, internal errors: splitting
+        # would only repeat the failure, and the other chunks still get their chance
+        return {user_id: str(e) for user_id in inputs}
+    await client.fetch_peers(result)
+    users = {user.id: types.User._parse(client, user) for user in result if isinstance(user, raw.types.User)}
+    return {user_id: users.get(user_id, "User not found") for user_id in inputs}
+
+async def lookup_users(client, user_ids: list) -> list:
+    """User or error message for each of ``user_ids``, in input order"""
+    results = {}
+    inputs = {}
+    for user_id in dict.fromkeys(user_ids):
+        try:
+            inputs[user_id] = await input_user(client, user_id)
+        except ValueError as e:
+            results[user_id] = str(e)
+
+    items = list(inputs.items())
+    semaphore = asyncio.Semaphore(USERS_CONCURRENCY)
+
+    async def fetch(chunk):
+        async with semaphore:
+            results.update(await fetch_users(client, dict(chunk)))
+        advance_job(len(chunk), total=len(items))
+
+    await asyncio.gather(*(fetch(items[i:i + USERS_CHUNK]) for i in range(0, len(items), USERS_CHUNK)))
+    return [results[user_id] for user_id in user_ids]
 
 @app.post("/get_users")
 async def get_users(req: GetUsersRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
+    try:
+        serialize = serializer("user", req.fields)
+    except ValueError as e:
+        return {"error": str(e)}
 
-    await client.start()
-    users = await client.get_users(req.user_ids)
-    await client.stop()
-    return {"users": [{"id": u.id, "first_name": u.first_name, "username": getattr(u, 'username', None)} for u in (users if isinstance(users, list) else [users]) ]}
+    async def load():
+        async with tg_clients.lease(req) as client:
+            return await lookup_users(client, req.user_ids)
+    users = await reads.do((account_id(req), "users", tuple(req.user_ids)), load)
+    return FastJSONResponse({"users": [
+        {"id": user_id, "error": user} if isinstance(user, str) else serialize(user)
+        for user_id, user in zip(req.user_ids, users)
+    ]})
 
 class GetUserProfilePhotosRequest(BaseModel):
     api_id: int
@@ -1459,28 +1306,11 @@ class GetUserProfilePhotosRequest(BaseModel):
 
 @app.post("/get_user_profile_photos")
 async def get_user_profile_photos(req: GetUserProfilePhotosRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    photos = await client.get_profile_photos(req.user_id, limit=req.limit, offset=req.offset)
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        photos = await client.get_profile_photos(req.user_id, limit=req.limit, offset=req.offset)
     return {"photos": [p.file_id for p in photos]}
 
 class GetContactsRequest(BaseModel):
@@ -1491,29 +1321,14 @@ class GetContactsRequest(BaseModel):
 
 @app.post("/get_contacts")
 async def get_contacts(req: GetContactsRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    contacts = await client.get_contacts()
-    await client.stop()
-    return {"contacts": [{"user_id": c.user.id, "first_name": c.user.first_name, "phone_number": getattr(c.user, 'phone_number', None)} for c in contacts]}
+    async def load():
+        async with tg_clients.lease(req) as client:
+            return await client.get_contacts()
+    contacts = await reads.do((account_id(req), "contacts"), load)
+    return {"contacts": [{"user_id": c.id, "first_name": c.first_name, "phone_number": getattr(c, 'phone_number', None)} for c in contacts]}
 
 class AddContactRequest(BaseModel):
     api_id: int
@@ -1527,33 +1342,16 @@ class AddContactRequest(BaseModel):
 
 @app.post("/add_contact")
 async def add_contact(req: AddContactRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    contact = await client.add_contact(
-        phone_number=req.phone_number,
-        first_name=req.first_name,
-        last_name=req.last_name,
-        user_id=req.user_id
-    )
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        contact = await client.add_contact(
+            phone_number=req.phone_number,
+            first_name=req.first_name,
+            last_name=req.last_name,
+            user_id=req.user_id
+        )
     return {"user_id": contact.id, "first_name": contact.first_name, "last_name": getattr(contact, 'last_name', None)}
 
 class DeleteContactsRequest(BaseModel):
@@ -1565,28 +1363,11 @@ class DeleteContactsRequest(BaseModel):
 
 @app.post("/delete_contacts")
 async def delete_contacts(req: DeleteContactsRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    result = await client.delete_contacts(req.user_ids)
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        result = await client.delete_contacts(req.user_ids)
     return {"result": result}
 
 class GetBotCommandsRequest(BaseModel):
@@ -1597,28 +1378,13 @@ class GetBotCommandsRequest(BaseModel):
 
 @app.post("/get_bot_commands")
 async def get_bot_commands(req: GetBotCommandsRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    commands = await client.get_bot_commands()
-    await client.stop()
+    async def load():
+        async with tg_clients.lease(req) as client:
+            return await client.get_bot_commands()
+    commands = await reads.do((account_id(req), "bot_commands"), load)
     return {"commands": [{"command": c.command, "description": c.description} for c in commands]}
 
 class SetBotCommandsRequest(BaseModel):
@@ -1630,28 +1396,11 @@ class SetBotCommandsRequest(BaseModel):
 
 @app.post("/set_bot_commands")
 async def set_bot_commands(req: SetBotCommandsRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    result = await client.set_bot_commands(req.commands)
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        result = await client.set_bot_commands(req.commands)
     return {"result": result}
 
 class DeleteBotCommandsRequest(BaseModel):
@@ -1662,28 +1411,11 @@ class DeleteBotCommandsRequest(BaseModel):
 
 @app.post("/delete_bot_commands")
 async def delete_bot_commands(req: DeleteBotCommandsRequest):
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
 
-    await client.start()
-    result = await client.delete_bot_commands()
-    await client.stop()
+    async with tg_clients.lease(req) as client:
+        result = await client.delete_bot_commands()
     return {"result": result}
 
 # API version endpoint
@@ -1722,89 +1454,39 @@ class RawApiRequest(BaseModel):
 @app.post("/raw_api")
 async def raw_api(req: RawApiRequest):
     """Call any raw Pyrogram API method (advanced)"""
-    if req.session_string:
-        client = Client(
-            name="user",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            session_string=req.session_string,
-            in_memory=True
-        )
-    elif req.bot_token:
-        client = Client(
-            name="bot",
-            api_id=req.api_id,
-            api_hash=req.api_hash,
-            bot_token=req.bot_token,
-            in_memory=True
-        )
-    else:
+    if not (req.session_string or req.bot_token):
         return {"error": "Provide session_string or bot_token"}
-    await client.start()
-    try:
-        result = await client.invoke(method=req.method, params=req.params)
-    except Exception as e:
-        await client.stop()
-        return {"error": str(e)}
-    await client.stop()
+
+    async with tg_clients.lease(req) as client:
+        try:
+            result = await client.invoke(method=req.method, params=req.params)
+        except Exception as e:
+            return {"error": str(e)}
     return {"result": str(result)}
 
 # Add missing endpoints that n8n node might call
 @app.post("/send_chat_action")
 async def send_chat_action(req: dict):
     """Send chat action (typing, uploading, etc.)"""
-    if req.get('session_string'):
-        client = Client(
-            name="user",
-            api_id=req['api_id'],
-            api_hash=req['api_hash'],
-            session_string=req['session_string'],
-            in_memory=True
-        )
-    elif req.get('bot_token'):
-        client = Client(
-            name="bot",
-            api_id=req['api_id'],
-            api_hash=req['api_hash'],
-            bot_token=req['bot_token'],
-            in_memory=True
-        )
-    else:
+    if not (req.get('session_string') or req.get('bot_token')):
         return {"error": "Provide session_string or bot_token"}
-    
-    await client.start()
-    result = await client.send_chat_action(
-        chat_id=req['chat_id'],
-        action=req.get('action', 'typing')
-    )
-    await client.stop()
+
+    async with tg_clients.lease(req) as client:
+        result = await client.send_chat_action(
+            chat_id=req['chat_id'],
+            action=req.get('action', 'typing')
+        )
     return {"result": result}
 
 @app.post("/join_chat")
 async def join_chat(req: dict):
     """Join a chat"""
-    if req.get('session_string'):
-        client = Client(
-            name="user",
-            api_id=req['api_id'],
-            api_hash=req['api_hash'],
-            session_string=req['session_string'],
-            in_memory=True
-        )
-    elif req.get('bot_token'):
-        client = Client(
-            name="bot",
-            api_id=req['api_id'],
-            api_hash=req['api_hash'],
-            bot_token=req['bot_token'],
-            in_memory=True
-        )
-    else:
+    if not (req.get('session_string') or req.get('bot_token')):
         return {"error": "Provide session_string or bot_token"}
-    
-    await client.start()
-    result = await client.join_chat(req['chat_id'])
-    await client.stop()
+
+    async with tg_clients.lease(req) as client:
+        result = await client.join_chat(req['chat_id'])
+    metadata_cache.invalidate(account_id(req), result.id)
     return {"chat": {"id": result.id, "title": getattr(result, 'title', None), "type": result.type}}
 
 # Add alias endpoints for backward compatibility
@@ -1824,6 +1506,439 @@ async def delete_messages_alias(req: DeleteMessageRequest):
     return await delete_message(req)
 
 @app.post("/get_chat_history")
-async def get_chat_history_alias(req: GetMessageHistoryRequest):
+async def get_chat_history_alias(req: GetMessageHistoryRequest, request: Request = None):
     """Alias for get_message_history"""
-    return await get_message_history(req)
+    return await get_message_history(req, request)
+
+# Streamed uploads: media bytes come from the raw request body, other params
+# as JSON in the X-Pyro-Params header
+UPLOAD_OPERATIONS = {
+    "send_photo": (SendPhotoRequest, "photo"),
+    "send_video": (SendVideoRequest, "video"),
+    "send_audio": (SendAudioRequest, "audio"),
+    "send_document": (SendDocumentRequest, "document"),
+    "send_voice": (SendVoiceRequest, "voice"),
+    "send_animation": (SendAnimationRequest, "animation"),
+    "send_video_note": (SendVideoNoteRequest, "video_note"),
+    "send_sticker": (SendStickerRequest, "sticker"),
+}
+CREDENTIAL_FIELDS = {"api_id", "api_hash", "session_string", "bot_token"}
+
+@app.post("/upload/{operation}")
+async def upload_media(operation: str, request: Request):
+    """Send media piped from the request body into Telegram without buffering the whole file"""
+    if operation not in UPLOAD_OPERATIONS:
+        return JSONResponse(status_code=404, content={"error": f"Unknown upload operation: {operation}"})
+    model, field = UPLOAD_OPERATIONS[operation]
+
+    try:
+        size = int(request.headers.get("content-length") or 0)
+        params = json.loads(request.headers.get("x-pyro-params") or "{}")
+        if not isinstance(params, dict):
+            raise ValueError("X-Pyro-Params must be a JSON object")
+        file_name = request.headers.get("x-file-name") or params.get("file_name") or field
+        req = model(**{**params, field: file_name})
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    if size <= 0:
+        return {"error": "Content-Length is required for streamed uploads"}
+    if not (req.session_string or req.bot_token):
+        return {"error": "Provide session_string or bot_token"}
+
+    kwargs = {
+        key: value for key, value in req.model_dump(exclude=CREDENTIAL_FIELDS | {field}).items()
+        if value is not None
+    }
+    # With X-Content-SHA256 a previously uploaded body is re-sent by file_id without reading it
+    content_hash = request.headers.get("x-content-sha256")
+    digest = f"sha256:{content_hash.lower()}" if content_hash else None
+    stream = UploadStream(request.stream(), size, file_name)
+    async with tg_clients.lease(req) as client:
+        send = partial(getattr(client, operation), **kwargs)
+        msg = await send_with_media_cache(req, field, stream, send, digest)
+    return {"message_id": msg.id, "chat_id": msg.chat.id, "date": msg.date}
+
+# Batch execution: many operations on one client in a single HTTP call
+BATCH_CONCURRENCY = int(os.environ.get("PYRO_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("PYRO_BATCH_MAX_CONCURRENCY", "32"))
+BATCH_EXCLUDED = {"batch"}
+
+class BatchItem(BaseModel):
+    operation: str
+    params: dict = {}
+
+class BatchRequest(BaseModel):
+    api_id: int
+    api_hash: str
+    session_string: Optional[str] = None
+    bot_token: Optional[str] = None
+    items: list[BatchItem]
+    concurrency: Optional[int] = None
+
+operations = {}
+
+def get_operations():
+    """Map operation names to (endpoint, request model) for every POST route taking a request body"""
+    if not operations:
+        for route in app.routes:
+            if not isinstance(route, APIRoute) or "POST" not in route.methods:
+                continue
+            name = route.path.lstrip("/")
+            param = inspect.signature(route.endpoint).parameters.get("req")
+            if name == "auth" or "/" in name or param is None:
+                continue
+            operations[name] = (route.endpoint, param.annotation)
+    return operations
+
+async def run_batch_item(item: BatchItem, credentials: dict):
+    operations = get_operations()
+    if item.operation not in operations or item.operation in BATCH_EXCLUDED:
+        return {"error": f"Unknown operation: {item.operation}"}
+    endpoint, model = operations[item.operation]
+    params = {**item.params, **credentials}
+    try:
+        req = params if model is dict else model(**params)
+        if getattr(req, "stream", False):
+            return {"error": "Streaming is not supported in batch"}
+        result = await endpoint(req)
+    except ValidationError as e:
+        # Field names and messages only: str(e) echoes input values, credentials included
+        errors = e.errors(include_url=False, include_input=False)
+        message = "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in errors)
+        return {"error": message, "type": "ValidationError"}
+    except FloodWait as e:
+        return {"error": str(e), "type": "FloodWait", "retry_after": e.value}
+    except Exception as e:
+        return {"error": str(e), "type": e.__class__.__name__}
+    if isinstance(result, Response):
+        # Listings return pre-encoded JSON
+        result = json.loads(result.body)
+    if isinstance(result, dict) and "error" in result:
+        return {"error": result["error"]}
+    return {"result": result}
+
+@app.post("/batch")
+async def batch(req: BatchRequest):
+    """Run many operations on one shared client, results are returned in input order"""
+    if not (req.session_string or req.bot_token):
+        return {"error": "Provide session_string or bot_token"}
+
+    credentials = {
+        "api_id": req.api_id,
+        "api_hash": req.api_hash,
+        "session_string": req.session_string,
+        "bot_token": req.bot_token,
+    }
+    concurrency = min(max(req.concurrency or BATCH_CONCURRENCY, 1), BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index: int, item: BatchItem):
+        async with semaphore:
+            outcome = await run_batch_item(item, credentials)
+        advance_job(total=len(req.items))
+        return {"index": index, "operation": item.operation, **outcome}
+
+    # Hold one lease for the whole batch so the client is started once and never evicted midway
+    async with tg_clients.lease(req):
+        results = await asyncio.gather(*(run(i, item) for i, item in enumerate(req.items)))
+    return {"results": results}
+
+# Broadcast: one message to many chats, media uploaded once
+BROADCAST_CONCURRENCY = int(os.environ.get("PYRO_BROADCAST_CONCURRENCY", "8"))
+BROADCAST_MAX_CONCURRENCY = int(os.environ.get("PYRO_BROADCAST_MAX_CONCURRENCY", "32"))
+BROADCAST_MEDIA_TYPES = ("photo", "video", "audio", "document", "animation", "voice", "video_note", "sticker")
+UNCAPTIONED_MEDIA_TYPES = ("video_note", "sticker")
+
+class BroadcastRequest(BaseModel):
+    api_id: int
+    api_hash: str
+    session_string: Optional[str] = None
+    bot_token: Optional[str] = None
+    chat_ids: list[int]
+    text: Optional[str] = None
+    media_type: Optional[str] = None
+    media: Optional[str] = None  # file path, URL, or file_id
+    caption: Optional[str] = None
+    parse_mode: Optional[str] = None
+    disable_notification: Optional[bool] = False
+    # Copy this message to every chat instead of sending text or media
+    from_chat_id: Optional[int] = None
+    message_id: Optional[int] = None
+    concurrency: Optional[int] = None
+    stream: Optional[bool] = False
+
+def broadcast_row(index: int, chat_id: int, msg=None, error: Exception = None) -> dict:
+    if error is None:
+        return {"index": index, "chat_id": chat_id, "message_id": msg.id, "date": msg.date}
+    row = {"index": index, "chat_id": chat_id, "error": str(error), "type": error.__class__.__name__}
+    if isinstance(error, FloodWait):
+        row["retry_after"] = error.value
+    return row
+
+def broadcast_sender(client, req: BroadcastRequest):
+    """``send(chat_id, **overrides)`` for the message described by ``req``"""
+    if req.message_id is not None:
+        return partial(
+            client.copy_message,
+            from_chat_id=req.from_chat_id,
+            message_id=req.message_id,
+            caption=req.caption,
+            parse_mode=req.parse_mode,
+            disable_notification=req.disable_notification
+        )
+    if req.media is None:
+        return partial(client.send_message, text=req.text, parse_mode=req.parse_mode, disable_notification=req.disable_notification)
+    kwargs = {"disable_notification": req.disable_notification}
+    if req.media_type not in UNCAPTIONED_MEDIA_TYPES:
+        kwargs.update(caption=req.caption, parse_mode=req.parse_mode)
+    return partial(getattr(client, f"send_{req.media_type}"), **kwargs)
+
+async def iter_broadcast(client, req: BroadcastRequest):
+    """Send to every chat of ``req``, yielding a result row per chat as sends complete.
+
+    Media is sent to the first chat that accepts it, then re-sent by the
+    file_id it got; a failure that is not Telegram rejecting that chat
+    (unreadable file, bad URL) ends the broadcast with the same error for
+    all remaining chats instead of retrying the upload for each.
+    """
+    send = broadcast_sender(client, req)
+    pending = deque(enumerate(req.chat_ids))
+    total = len(pending)
+    if req.media is not None:
+        field, media = req.media_type, req.media
+        while pending:
+            index, chat_id = pending.popleft()
+            try:
+                msg = await send_with_media_cache(req, field, media, partial(send, chat_id=chat_id))
+            except RPCError as e:
+                advance_job(total=total)
+                yield broadcast_row(index, chat_id, error=e)
+                continue
+            except Exception as e:
+                for index, chat_id in [(index, chat_id), *pending]:
+                    yield broadcast_row(index, chat_id, error=e)
+                advance_job(len(pending) + 1, total=total)
+                return
+            advance_job(total=total)
+            yield broadcast_row(index, chat_id, msg)
+            # Another kind's file_id would be rejected by this send call: re-send the original then
+            uploaded = getattr(msg, field, None)
+            send = partial(send, **{field: uploaded.file_id if uploaded is not None else media})
+            break
+
+    # The client's scheduler keeps sends within the account's rate limits and sits out FloodWaits
+    results = asyncio.Queue()
+    remaining = len(pending)
+
+    async def worker():
+        while pending:
+            index, chat_id = pending.popleft()
+            try:
+                row = broadcast_row(index, chat_id, await send(chat_id=chat_id))
+            except Exception as e:
+                row = broadcast_row(index, chat_id, error=e)
+            advance_job(total=total)
+            results.put_nowait(row)
+
+    concurrency = min(max(req.concurrency or BROADCAST_CONCURRENCY, 1), BROADCAST_MAX_CONCURRENCY)
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, remaining))]
+    try:
+        for _ in range(remaining):
+            yield await results.get()
+    finally:
+        # Stop sending when the caller went away
+        for task in workers:
+            task.cancel()
+
+@app.post("/broadcast")
+async def broadcast(req: BroadcastRequest, request: Request = None):
+    """Send one text, media or copied message to many chats"""
+    if not (req.session_string or req.bot_token):
+        return {"error": "Provide session_string or bot_token"}
+    if sum((req.text is not None, req.media is not None, req.message_id is not None)) != 1:
+        return {"error": "Provide exactly one of text, media or message_id"}
+    if req.media is not None and req.media_type not in BROADCAST_MEDIA_TYPES:
+        return {"error": f"media_type must be one of: {', '.join(BROADCAST_MEDIA_TYPES)}"}
+    if req.message_id is not None and req.from_chat_id is None:
+        return {"error": "from_chat_id is required with message_id"}
+
+    rows = partial(iter_broadcast, req=req)
+    if wants_stream(req, request):
+        return stream_ndjson(req, rows)
+
+    async with tg_clients.lease(req) as client:
+        results = [row async for row in rows(client)]
+    results.sort(key=lambda row: row["index"])
+    failed = sum(1 for row in results if "error" in row)
+    return FastJSONResponse({"results": results, "sent": len(results) - failed, "failed": failed})
+
+# Background jobs: POST any operation with ?async=true to get a job id right away
+jobs = JobManager()
+
+async def run_job_operation(endpoint, req):
+    result = await endpoint(req)
+    if isinstance(result, Response):
+        # Pre-encoded listings and error responses such as 501 stubs; their JSON body becomes the job outcome
+        return json.loads(result.body)
+    return result
+
+@app.middleware("http")
+async def submit_async_jobs(request: Request, call_next):
+    """Run the requested operation as a background job when called with ?async=true"""
+    if request.method != "POST" or request.query_params.get("async", "").lower() not in ("1", "true"):
+        return await call_next(request)
+
+    operation = request.url.path.lstrip("/")
+    if operation not in get_operations():
+        return JSONResponse(status_code=404, content={"error": f"Unknown operation: {operation}"})
+    endpoint, model = get_operations()[operation]
+    try:
+        params = await request.json()
+        if not isinstance(params, dict):
+            raise ValueError("Request body must be a JSON object")
+        req = params if model is dict else model(**params)
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"error": str(e)})
+    if getattr(req, "stream", False):
+        return JSONResponse(status_code=400, content={"error": "Streaming is not supported in async jobs"})
+
+    job = jobs.submit(operation, partial(run_job_operation, endpoint, req))
+    return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status, progress, result and error"""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job.to_dict()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return {"job_id": job.id, "status": job.status}
+
+# Triggers: updates received by an account's client are pushed to n8n webhooks
+@app.post("/triggers/add")
+async def add_trigger(req: dict, request: Request):
+    """Register a webhook trigger for updateTypes matching filters"""
+    if not (req.get('session_string') or req.get('bot_token')):
+        return {"error": "Provide session_string or bot_token"}
+
+    try:
+        trigger = await trigger_service.add_trigger(req, request.headers.get("x-webhook-secret"))
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"trigger_id": trigger.id, "update_types": sorted(trigger.filter.update_types)}
+
+@app.post("/triggers/remove")
+async def remove_trigger(req: dict):
+    """Unregister a webhook trigger"""
+    trigger = await trigger_service.remove_trigger(req.get('trigger_id'))
+    if trigger is None:
+        return JSONResponse(status_code=404, content={"error": "Trigger not found"})
+    return {"trigger_id": trigger.id, "removed": True}
+
+@app.get("/triggers/list")
+async def list_triggers():
+    """Registered triggers with delivery counters"""
+    return {"triggers": trigger_service.list_triggers()}
+
+@app.get("/triggers/dead_letters")
+async def list_dead_letters(trigger_id: Optional[str] = None, limit: int = 100):
+    """Updates whose webhook delivery failed after all retries"""
+    return {"dead_letters": trigger_service.dead_letters(trigger_id, limit)}
+
+@app.post("/triggers/dead_letters/replay")
+async def replay_dead_letters(req: dict):
+    """Re-deliver dead letters selected by seqs and/or trigger_id"""
+    results = await trigger_service.replay_dead_letters(req.get('seqs'), req.get('trigger_id'), req.get('limit', 100))
+    return {"results": results}
+
+# Per-phase timings (pool, client_init, start, rate_limit, rpc, resolve_peer, upload, download, stop)
+# in a Server-Timing header; with ?debug=true or X-Pyro-Debug also in a "debug" field of JSON bodies
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    timings = Timings()
+    current_timings.set(timings)
+    response = await call_next(request)
+    debug = request.query_params.get("debug", "").lower() in ("1", "true") or request.headers.get("x-pyro-debug")
+    if debug and response.headers.get("content-type", "").startswith("application/json"):
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        content = json.loads(body)
+        if isinstance(content, dict):
+            content["debug"] = {"timings": timings.to_dict()}
+            body = json.dumps(content).encode()
+        headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+        response = Response(body, status_code=response.status_code, headers=headers)
+    # Streamed responses only cover the phases that ran before the headers were sent
+    response.headers["Server-Timing"] = timings.header()
+    return response
+
+# Metrics: Prometheus text format on GET /metrics
+@registry.collector
+def collect_backend_metrics():
+    pool = tg_clients.stats()
+    triggers = list(trigger_service.triggers.values())
+    deliveries = [trigger.delivery.stats() for trigger in triggers]
+    totals = trigger_service.totals()
+    store = trigger_service.store.stats()
+    return [
+        snapshot("gauge", "pyro_pool_clients", "Started clients in the pool", pool["clients"]),
+        snapshot("gauge", "pyro_pool_leased_clients", "Pooled clients currently leased", pool["leased"]),
+        snapshot("counter", "pyro_flood_waits_total", "FloodWait errors received", sum(s.flood_waits for s in schedulers.values())),
+        snapshot("counter", "pyro_flood_wait_seconds_total", "Seconds of FloodWait imposed on accounts", sum(s.flood_wait_seconds for s in schedulers.values())),
+        snapshot("counter", "pyro_media_cache_hits_total", "Media sent by cached file_id", media_cache.hits),
+        snapshot("counter", "pyro_media_cache_misses_total", "Media lookups that had to upload", media_cache.misses),
+        snapshot("counter", "pyro_coalesced_reads_total", "Reads that joined an identical in-flight request instead of calling Telegram", reads.coalesced),
+        snapshot("counter", "pyro_metadata_cache_hits_total", "Chat metadata served from cache", metadata_cache.hits),
+        snapshot("counter", "pyro_metadata_cache_misses_total", "Chat metadata fetched from Telegram", metadata_cache.misses),
+        snapshot("counter", "pyro_metadata_cache_invalidations_total", "Cached chats dropped after an update", metadata_cache.invalidations),
+        snapshot("gauge", "pyro_metadata_cache_entries", "Cached chat metadata entries", len(metadata_cache.entries)),
+        snapshot("gauge", "pyro_jobs", "Background jobs by status", {(status,): count for status, count in jobs.stats().items()}, ("status",)),
+        snapshot("gauge", "pyro_triggers", "Registered triggers by kind", {
+            ("updates",): sum(1 for trigger in triggers if trigger.poller is None),
+            ("polling",): sum(1 for trigger in triggers if trigger.poller is not None),
+        }, ("kind",)),
+        snapshot("counter", "pyro_trigger_matched_total", "Updates matched by triggers", totals["matched"]),
+        snapshot("counter", "pyro_trigger_delivered_total", "Updates delivered to webhooks", totals["delivered"]),
+        snapshot("counter", "pyro_trigger_failed_total", "Failed webhook delivery attempts, per update", totals["failed"]),
+        snapshot("counter", "pyro_trigger_dead_lettered_total", "Updates moved to dead letters", totals["dead_lettered"]),
+        snapshot("counter", "pyro_trigger_dropped_total", "Updates dropped by drop_oldest queues", totals["dropped"]),
+        snapshot("gauge", "pyro_trigger_queue_depth", "Updates waiting for delivery", sum(d["depth"] for d in deliveries)),
+        snapshot("gauge", "pyro_trigger_spilled", "Queued updates held on disk only", sum(d["spilled"] for d in deliveries)),
+        snapshot("gauge", "pyro_delivery_outbox", "Updates in the durable outbox", store["outbox"]),
+        snapshot("gauge", "pyro_delivery_dead_letters", "Stored dead letters", store["dead_letters"]),
+    ]
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    """Count requests and time them by route template (outermost middleware, so async submissions count too)"""
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    except Exception as e:
+        HTTP_EXCEPTIONS.inc(e.__class__.__name__)
+        status = 500
+        raise
+    finally:
+        route = request.scope.get("route")
+        if route is not None:
+            path = route.path
+        elif request.url.path.lstrip("/") in get_operations():
+            # Async submissions are answered before routing; the operation's path is its route template
+            path = request.url.path
+        else:
+            path = "unmatched"
+        HTTP_REQUESTS.inc(path, request.method, status)
+        HTTP_LATENCY.observe(time.perf_counter() - start, path)
+    return response
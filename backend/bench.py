@@ -0,0 +1,295 @@
+"""Benchmark the backend in-process against a fake Pyrogram client.
+
+    python bench.py --workloads send_message,get_message_history --requests 5000 --concurrency 100
+
+Results are printed as JSON (one object per workload) so runs can be compared.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+import pyrogram
+from pyrogram import enums, raw, types
+from pyrogram.errors import FloodWait
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BenchClient:
+    """Stand-in for pyrogram.Client: every RPC goes through invoke(), which
+    sleeps ``latency`` seconds and raises FloodWait with ``flood_rate`` probability.
+    Chat histories of ``history_size`` messages are generated on the fly."""
+
+    latency = 0.005
+    flood_rate = 0.0
+    flood_seconds = 1
+    history_size = 5_000_000
+    media_size = 8 * CHUNK_SIZE
+    rpcs = 0
+    flood_waits = 0
+
+    def __init__(self, name, api_id=None, api_hash=None, session_string=None, bot_token=None, **kwargs):
+        self.name = name
+        self.is_connected = None
+        self.is_initialized = None
+        self.me = types.User(id=1, is_bot=bot_token is not None, first_name="bench", is_premium=False)
+        self.chunk = bytes(CHUNK_SIZE)
+
+    async def start(self):
+        await asyncio.sleep(self.latency * 3)
+        self.is_connected = self.is_initialized = True
+        return self
+
+    async def stop(self):
+        self.is_connected = self.is_initialized = False
+        return self
+
+    def add_handler(self, handler, group=0):
+        return handler, group
+
+    def remove_handler(self, handler, group=0):
+        pass
+
+    async def invoke(self, query, retries=0, timeout=0, sleep_threshold=None):
+        BenchClient.rpcs += 1
+        await asyncio.sleep(self.latency)
+        if self.flood_rate and random.random() < self.flood_rate:
+            BenchClient.flood_waits += 1
+            raise FloodWait(value=self.flood_seconds)
+        return True
+
+    async def resolve_peer(self, peer_id):
+        return raw.types.InputPeerUser(user_id=abs(int(peer_id)), access_hash=0)
+
+    def message(self, chat_id, message_id, text=None, **kwargs):
+        return types.Message(
+            id=message_id,
+            chat=types.Chat(id=chat_id, type=enums.ChatType.SUPERGROUP if chat_id < 0 else enums.ChatType.PRIVATE, title="bench"),
+            from_user=types.User(id=message_id % 1000 + 1, first_name="user", username=f"user{message_id % 1000}"),
+            date=datetime.datetime.fromtimestamp(1_700_000_000 + message_id),
+            text=text,
+            **kwargs
+        )
+
+    async def send_message(self, chat_id, text, parse_mode=None, disable_notification=None, **kwargs):
+        peer = await self.resolve_peer(chat_id)
+        await self.invoke(raw.functions.messages.SendMessage(peer=peer, message=text, random_id=self.rnd_id()))
+        return self.message(chat_id, random.randint(1, 2 ** 31), text)
+
+    async def get_chat_history(self, chat_id, limit=0, offset_id=0, **kwargs):
+        top = min(offset_id - 1 if offset_id else self.history_size, self.history_size)
+        remaining = limit or top
+        while remaining > 0 and top > 0:
+            # One GetHistory RPC per page of up to 100 messages, as Pyrogram does
+            page = min(100, remaining, top)
+            await self.invoke(raw.functions.help.GetConfig())
+            for message_id in range(top, top - page, -1):
+                yield self.message(chat_id, message_id, f"Synthetic message {message_id} in chat {chat_id}")
+            top -= page
+            remaining -= page
+
+    async def get_messages(self, chat_id, message_ids, **kwargs):
+        await self.invoke(raw.functions.help.GetConfig())
+        ids = message_ids if isinstance(message_ids, list) else [message_ids]
+        document = types.Document(
+            file_id="bench", file_unique_id="bench", file_name="bench.bin",
+            mime_type="application/octet-stream", file_size=self.media_size
+        )
+        messages = [self.message(chat_id, message_id, document=document, media=enums.MessageMediaType.DOCUMENT) for message_id in ids]
+        return messages if isinstance(message_ids, list) else messages[0]
+
+    async def stream_media(self, message, limit=0, offset=0):
+        chunks = -(-self.media_size // CHUNK_SIZE)
+        end = min(chunks, offset + limit) if limit else chunks
+        for index in range(offset, end):
+            await self.invoke(raw.functions.help.GetConfig())
+            size = min(CHUNK_SIZE, self.media_size - index * CHUNK_SIZE)
+            yield self.chunk if size == CHUNK_SIZE else self.chunk[:size]
+
+    @staticmethod
+    def rnd_id():
+        return random.randint(-2 ** 63, 2 ** 63 - 1)
+
+
+async def asgi_request(app, path: str, payload: dict):
+    """POST ``payload`` to ``path`` straight through the ASGI app; returns (status, body size, error)"""
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"status": None, "size": 0, "error": False}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Never disconnect; whoever waits for it is cancelled when the response is done
+        await asyncio.Future()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            # Failures are reported as {"error": ...} bodies with status 200
+            if not response["size"] and chunk.startswith(b'{"error"'):
+                response["error"] = True
+            response["size"] += len(chunk)
+
+    await app(scope, receive, send)
+    return response["status"], response["size"], response["error"]
+
+
+CREDENTIALS = {"api_id": 1, "api_hash": "bench", "session_string": "bench"}
+
+
+def workload_requests(name: str, args):
+    """Factory of (path, payload) for request number ``i`` of a workload"""
+    if name == "send_message":
+        return lambda i: ("/send_message", {**CREDENTIALS, "chat_id": 1000 + i % args.chats, "text": f"Benchmark message {i}"})
+    if name == "get_message_history":
+        return lambda i: ("/get_message_history", {
+            **CREDENTIALS, "chat_id": -100, "limit": args.page_size,
+            "offset_id": random.randint(args.page_size + 1, BenchClient.history_size),
+        })
+    if name == "download_media":
+        return lambda i: ("/download_media", {**CREDENTIALS, "chat_id": -100, "message_id": i + 1, "stream": True})
+    if name == "batch":
+        return lambda i: ("/batch", {**CREDENTIALS, "items": [
+            {"operation": "send_message", "params": {"chat_id": 1000 + (i * args.batch_size + j) % args.chats, "text": "Batch message"}}
+            for j in range(args.batch_size)
+        ]})
+    raise ValueError(f"Unknown workload: {name}")
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+async def run_workload(app, name: str, args) -> dict:
+    make_request = workload_requests(name, args)
+    for i in range(args.warmup):
+        await asgi_request(app, *make_request(i))
+
+    rpcs, flood_waits = BenchClient.rpcs, BenchClient.flood_waits
+    if args.tracemalloc:
+        tracemalloc.reset_peak()
+    latencies = []
+    statuses = {}
+    sizes = 0
+    errors = 0
+    counter = iter(range(args.requests))
+
+    async def worker():
+        nonlocal sizes, errors
+        for i in counter:
+            start = time.perf_counter()
+            status, size, error = await asgi_request(app, *make_request(i))
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            sizes += size
+            errors += error
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    return {
+        "workload": name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p90": round(percentile(latencies, 0.90) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": errors,
+        "response_mb": round(sizes / 2 ** 20, 3),
+        "rpcs": BenchClient.rpcs - rpcs,
+        "flood_waits": BenchClient.flood_waits - flood_waits,
+        "memory_mb": {
+            "rss_peak": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "python_peak": round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1) if args.tracemalloc else None,
+        },
+    }
+
+
+async def run(args) -> list:
+    import app as backend
+    from metrics import CLIENT_STARTS
+
+    results = []
+    for name in args.workloads.split(","):
+        starts = CLIENT_STARTS.values.get((), 0)
+        result = await run_workload(backend.app, name.strip(), args)
+        # More than one start per run means the client lifecycle regressed (clients are pooled)
+        result["client_starts"] = CLIENT_STARTS.values.get((), 0) - starts
+        results.append(result)
+    await backend.trigger_service.stop()
+    await backend.tg_clients.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workloads", default="send_message,get_message_history,download_media,batch")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5, help="simulated latency of every RPC")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="probability of FloodWait per RPC")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--history-size", type=int, default=5_000_000, help="messages in each synthetic chat")
+    parser.add_argument("--page-size", type=int, default=100, help="get_message_history limit")
+    parser.add_argument("--media-mb", type=float, default=8, help="size of the downloaded document")
+    parser.add_argument("--batch-size", type=int, default=50, help="items per /batch request")
+    parser.add_argument("--chats", type=int, default=10000, help="distinct chat ids sends are spread over")
+    parser.add_argument("--real-rate-limits", action="store_true", help="keep Telegram send rate limits (off by default)")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Configuration must be in place before the backend modules are imported
+    os.environ.pop("PYRO_SESSION_DIR", None)
+    os.environ.setdefault("PYRO_DELIVERY_DB", ":memory:")
+    if not args.real_rate_limits:
+        for name in ("GLOBAL", "PER_CHAT", "PER_GROUP"):
+            os.environ[f"PYRO_RATE_{name}"] = os.environ[f"PYRO_RATE_{name}_BURST"] = "1000000000"
+    BenchClient.latency = args.latency_ms / 1000
+    BenchClient.flood_rate = args.flood_rate
+    BenchClient.flood_seconds = args.flood_seconds
+    BenchClient.history_size = args.history_size
+    BenchClient.media_size = int(args.media_mb * 2 ** 20)
+    pyrogram.Client = BenchClient
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from pyrogram.errors import RpcConnectFailed
+
+from metrics import CLIENT_STARTS, CLIENT_STOPS
+from pyro_client import PyroClient
+from rate_limit import get_scheduler
+from session_storage import PEER_COMPACT_INTERVAL, SESSION_DIR, PersistentStorage, session_name
+from timing import phase
+
+# Pool settings (can be overridden via environment)
+POOL_MAX_CLIENTS = int(os.environ.get("PYRO_POOL_MAX_CLIENTS", "32"))
+POOL_IDLE_TTL = float(os.environ.get("PYRO_POOL_IDLE_TTL", "900"))
+POOL_REAP_INTERVAL = float(os.environ.get("PYRO_POOL_REAP_INTERVAL", "60"))
+# Concurrent media transfers per client (Pyrogram's default of 1 serializes parallel downloads)
+POOL_MAX_TRANSMISSIONS = int(os.environ.get("PYRO_POOL_MAX_TRANSMISSIONS", "8"))
+
+# Errors after which a pooled connection may be dead (not OSError as a whole:
+# a missing file or a failed local read says nothing about the connection)
+CONNECTION_ERRORS = (ConnectionError, asyncio.TimeoutError, RpcConnectFailed)
+
+
+def get_credentials(req):
+    """Extract (api_id, api_hash, session_string, bot_token) from a request model or dict"""
+    if isinstance(req, dict):
+        return req.get("api_id"), req.get("api_hash"), req.get("session_string"), req.get("bot_token")
+    return req.api_id, req.api_hash, req.session_string, req.bot_token
+
+
+def credentials_key(api_id, session_string=None, bot_token=None):
+    """Pool key: api_id plus a hash of the secret, so secrets are never kept as dict keys"""
+    secret = session_string or bot_token
+    if not secret:
+        return None
+    kind = "user" if session_string else "bot"
+    return (int(api_id), kind, hashlib.sha256(secret.encode()).hexdigest())
+
+
+def key_account(key) -> str:
+    return ":".join(str(part) for part in key)
+
+
+def account_id(req) -> str:
+    """Stable per-account identifier (no secrets) for caches and limiters"""
+    api_id, _, session_string, bot_token = get_credentials(req)
+    return key_account(credentials_key(api_id, session_string, bot_token))
+
+
+class PoolEntry:
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.broken = False
+        self.lock = asyncio.Lock()
+        # (handler, group) pairs to install on every client this entry starts
+        self.handlers = []
+
+
+class ClientPool:
+    """Keeps started Pyrogram clients alive and shares them between requests.
+
+    Clients are keyed by api_id and credential hash, evicted in LRU order when
+    the pool is over capacity and stopped after being idle for ``idle_ttl``
+    seconds. Clients that lost their connection are restarted on next use.
+
+    With ``session_dir`` set, every credential gets a persistent SQLite
+    session file there instead of an in-memory one, so auth keys and the
+    peer cache are reused across restarts.
+    """
+
+    def __init__(self, max_clients=POOL_MAX_CLIENTS, idle_ttl=POOL_IDLE_TTL, session_dir=SESSION_DIR):
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self.session_dir = Path(session_dir) if session_dir else None
+        self.entries = OrderedDict()
+        self.lock = asyncio.Lock()
+        self.reaper = None
+        self.last_compact = time.monotonic()
+        # Called with the entry after each client (re)start and before it is stopped
+        self.on_start = []
+        self.on_stop = []
+
+    def build_client(self, api_id, api_hash, session_string=None, bot_token=None):
+        with phase("client_init"):
+            client = self.new_client(api_id, api_hash, session_string, bot_token)
+        client.scheduler = get_scheduler(key_account(credentials_key(api_id, session_string, bot_token)))
+        return client
+
+    def new_client(self, api_id, api_hash, session_string=None, bot_token=None):
+        if self.session_dir is not None:
+            name = session_name(credentials_key(api_id, session_string, bot_token))
+            client = PyroClient(
+                name=name,
+                api_id=api_id,
+                api_hash=api_hash,
+                bot_token=None if session_string else bot_token,
+                workdir=str(self.session_dir),
+                max_concurrent_transmissions=POOL_MAX_TRANSMISSIONS
+            )
+            client.storage = PersistentStorage(name, self.session_dir, session_string)
+            return client
+        if session_string:
+            return PyroClient(
+                name="user",
+                api_id=api_id,
+                api_hash=api_hash,
+                session_string=session_string,
+                in_memory=True,
+                max_concurrent_transmissions=POOL_MAX_TRANSMISSIONS
+            )
+        return PyroClient(
+            name="bot",
+            api_id=api_id,
+            api_hash=api_hash,
+            bot_token=bot_token,
+            in_memory=True,
+            max_concurrent_transmissions=POOL_MAX_TRANSMISSIONS
+        )
+
+    async def acquire(self, req):
+        api_id, api_hash, session_string, bot_token = get_credentials(req)
+        key = credentials_key(api_id, session_string, bot_token)
+        if key is None:
+            raise ValueError("Provide session_string or bot_token")
+
+        if self.reaper is None:
+            self.reaper = asyncio.create_task(self.reap_forever())
+
+        with phase("pool"):
+            async with self.lock:
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = PoolEntry(key, self.build_client(api_id, api_hash, session_string, bot_token))
+                    self.entries[key] = entry
+                self.entries.move_to_end(key)
+                entry.leases += 1
+                evicted = self.pop_over_capacity()
+
+        for old in evicted:
+            await self.stop_entry(old)
+
+        try:
+            await self.ensure_started(entry, api_id, api_hash, session_string, bot_token)
+        except BaseException:
+            entry.leases -= 1
+            raise
+        return entry
+
+    def release(self, entry):
+        entry.leases -= 1
+        entry.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def lease(self, req):
+        """Borrow a started client for the duration of the ``async with`` block"""
+        entry = await self.acquire(req)
+        try:
+            yield entry.client
+        except CONNECTION_ERRORS as e:
+            # The client is shared (a trigger listener may even pin it), so one
+            # timed-out RPC only fails this request: it is rebuilt once it has
+            # really disconnected, or on a connection error nobody else shares
+            if not entry.client.is_connected or (entry.leases == 1 and not isinstance(e, asyncio.TimeoutError)):
+                entry.broken = True
+            raise
+        finally:
+            self.release(entry)
+
+    async def ensure_started(self, entry, api_id, api_hash, session_string, bot_token):
+        async with entry.lock:
+            if entry.client.is_connected and not entry.broken:
+                return
+            if entry.client.is_initialized or entry.broken:
+                # Dead connection: drop the old client and start a fresh one
+                await self.stop_client(entry.client)
+                entry.client = self.build_client(api_id, api_hash, session_string, bot_token)
+                entry.broken = False
+                for handler, group in entry.handlers:
+                    entry.client.add_handler(handler, group)
+            with phase("start"):
+                await entry.client.start()
+            CLIENT_STARTS.inc()
+            for hook in self.on_start:
+                hook(entry)
+
+    @staticmethod
+    def add_handler(entry, handler, group: int = 0):
+        """Register an update handler on ``entry``'s client, kept across client restarts"""
+        entry.handlers.append((handler, group))
+        entry.client.add_handler(handler, group)
+
+    @staticmethod
+    def remove_handler(entry, handler, group: int = 0):
+        entry.handlers.remove((handler, group))
+        entry.client.remove_handler(handler, group)
+
+    def pop_over_capacity(self):
+        """Remove least recently used idle entries while the pool is over capacity"""
+        evicted = []
+        for key in list(self.entries):
+            if len(self.entries) <= self.max_clients:
+                break
+            entry = self.entries[key]
+            if entry.leases == 0:
+                evicted.append(self.entries.pop(key))
+        return evicted
+
+    async def reap_idle(self):
+        now = time.monotonic()
+        async with self.lock:
+            expired = [
+                key for key, entry in self.entries.items()
+                if entry.leases == 0 and now - entry.last_used > self.idle_ttl
+            ]
+            evicted = [self.entries.pop(key) for key in expired]
+        for entry in evicted:
+            await self.stop_entry(entry)
+
+    def compact_sessions(self):
+        for entry in list(self.entries.values()):
+            storage = entry.client.storage
+            if isinstance(storage, PersistentStorage) and entry.client.is_connected:
+                storage.compact()
+
+    async def reap_forever(self):
+        while True:
+            await asyncio.sleep(POOL_REAP_INTERVAL)
+            await self.reap_idle()
+            if self.session_dir is not None and time.monotonic() - self.last_compact > PEER_COMPACT_INTERVAL:
+                self.compact_sessions()
+                self.last_compact = time.monotonic()
+
+    async def stop_entry(self, entry):
+        for hook in self.on_stop:
+            hook(entry)
+        async with entry.lock:
+            await self.stop_client(entry.client)
+
+    @staticmethod
+    async def stop_client(client):
+        if not client.is_initialized and not client.is_connected:
+            return
+        try:
+            with phase("stop"):
+                await client.stop()
+        except Exception:
+            pass
+        CLIENT_STOPS.inc()
+
+    async def close(self):
+        if self.reaper is not None:
+            self.reaper.cancel()
+            self.reaper = None
+        async with self.lock:
+            evicted = list(self.entries.values())
+            self.entries.clear()
+        for entry in evicted:
+            await self.stop_entry(entry)
+
+    def stats(self):
+        return {
+            "clients": len(self.entries),
+            "leased": sum(1 for entry in self.entries.values() if entry.leases),
+            "max_clients": self.max_clients,
+        }
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from session_storage import SESSION_DIR
+
+# Durable delivery queue settings (can be overridden via environment)
+# ":memory:" is possible but loses queued updates and poll cursors on every restart
+DELIVERY_DB = os.environ.get(
+    "PYRO_DELIVERY_DB",
+    os.path.join(SESSION_DIR or os.path.dirname(os.path.abspath(__file__)), "deliveries.db")
+)
+# Queued updates are written in one transaction every FLUSH_MS, and the WAL is
+# checkpointed (fsynced) every SYNC_INTERVAL seconds rather than on every commit
+DELIVERY_FLUSH_MS = float(os.environ.get("PYRO_DELIVERY_FLUSH_MS", "100"))
+DELIVERY_SYNC_INTERVAL = float(os.environ.get("PYRO_DELIVERY_SYNC_INTERVAL", "1"))
+# Cursors of polling triggers that were not registered for this long are forgotten
+POLL_CURSOR_TTL = float(os.environ.get("PYRO_POLL_CURSOR_TTL", str(30 * 24 * 3600)))
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox
+(
+    seq         INTEGER PRIMARY KEY,
+    trigger_id  TEXT NOT NULL,
+    webhook_url TEXT NOT NULL,
+    secret      TEXT,
+    payload     TEXT NOT NULL,
+    created     REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dead_letters
+(
+    seq         INTEGER PRIMARY KEY,
+    trigger_id  TEXT NOT NULL,
+    webhook_url TEXT NOT NULL,
+    secret      TEXT,
+    payload     TEXT NOT NULL,
+    created     REAL NOT NULL,
+    attempts    INTEGER NOT NULL,
+    failed_at   REAL NOT NULL,
+    last_error  TEXT
+);
+
+CREATE TABLE IF NOT EXISTS poll_cursors
+(
+    key     TEXT PRIMARY KEY,
+    state   TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_trigger ON outbox (trigger_id, seq);
+
+CREATE INDEX IF NOT EXISTS idx_dead_letters_trigger ON dead_letters (trigger_id, seq);
+"""
+
+
+class DeliveryStore:
+    """Disk-backed outbox for webhook deliveries, with a dead-letter table.
+
+    Every update is recorded before delivery and removed once its webhook
+    accepted it. Inserts and deletes are buffered and written in batches;
+    an update delivered before its batch was flushed never touches disk.
+    Updates still in the outbox at startup (the backend stopped before
+    delivering them) are moved to dead letters, from where they can be
+    replayed.
+
+    It also keeps the cursors of polling triggers, written only after the
+    updates they cover reached the outbox.
+    """
+
+    def __init__(self, path=DELIVERY_DB, flush_ms=DELIVERY_FLUSH_MS, sync_interval=DELIVERY_SYNC_INTERVAL):
+        self.flush_interval = flush_ms / 1000
+        self.sync_interval = sync_interval
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        else:
+            log.warning("Delivery store is in memory: queued webhook updates and poll cursors are lost on restart")
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Commits only write the WAL; it is fsynced when checkpointed by sync()
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.inserts = {}
+        self.deletes = []
+        self.last_seq = 0
+        self.last_sync = time.monotonic()
+        self.flusher = None
+        self.recover()
+
+    def next_seq(self) -> int:
+        # Time based so order is kept across restarts
+        self.last_seq = max(time.time_ns(), self.last_seq + 1)
+        return self.last_seq
+
+    def add(self, trigger, payload: str) -> int:
+        seq = self.next_seq()
+        self.inserts[seq] = (seq, trigger.id, trigger.webhook_url, trigger.secret, payload, time.time())
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.flush_forever())
+        return seq
+
+    def delete(self, seqs):
+        for seq in seqs:
+            if self.inserts.pop(seq, None) is None:
+                self.deletes.append((seq,))
+
+    def load(self, trigger_id: str, after_seq: int, limit: int) -> list:
+        """(seq, payload) of a trigger's outbox rows after ``after_seq``, oldest first"""
+        return self.conn.execute(
+            "SELECT seq, payload FROM outbox WHERE trigger_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (trigger_id, after_seq, limit)
+        ).fetchall()
+
+    def drop_after(self, trigger_id: str, after_seq: int):
+        with self.conn:
+            self.conn.execute("DELETE FROM outbox WHERE trigger_id = ? AND seq > ?", (trigger_id, after_seq))
+
+    def flush(self):
+        if not self.inserts and not self.deletes:
+            return
+        inserts, self.inserts = list(self.inserts.values()), {}
+        deletes, self.deletes = self.deletes, []
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO outbox (seq, trigger_id, webhook_url, secret, payload, created) VALUES (?, ?, ?, ?, ?, ?)",
+                inserts
+            )
+            self.conn.executemany("DELETE FROM outbox WHERE seq = ?", deletes)
+
+    def sync(self):
+        self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        self.last_sync = time.monotonic()
+
+    async def flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+            if time.monotonic() - self.last_sync > self.sync_interval:
+                self.sync()
+
+    def dead_letter(self, seqs, attempts: int, error: str):
+        """Move undeliverable updates from the outbox to dead letters"""
+        self.flush()
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO dead_letters "
+                "SELECT seq, trigger_id, webhook_url, secret, payload, created, ?, ?, ? FROM outbox WHERE seq = ?",
+                [(attempts, now, error, seq) for seq in seqs]
+            )
+            self.conn.executemany("DELETE FROM outbox WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def recover(self):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dead_letters "
+                "SELECT seq, trigger_id, webhook_url, secret, payload, created, 0, ?, ? FROM outbox",
+                (now, "Backend stopped before delivery")
+            )
+            self.conn.execute("DELETE FROM outbox")
+            self.conn.execute("DELETE FROM poll_cursors WHERE updated < ?", (now - POLL_CURSOR_TTL,))
+
+    def load_cursor(self, key: str):
+        row = self.conn.execute("SELECT state FROM poll_cursors WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_cursor(self, key: str, state: dict):
+        # Updates emitted by the poll go to disk first, so a crash can't skip them
+        self.flush()
+        with self.conn:
+            self.conn.execute(
+                "REPLACE INTO poll_cursors (key, state, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(state), time.time())
+            )
+
+    def dead_letters(self, trigger_id: str = None, limit: int = 100, seqs: list = None) -> list:
+        query = "SELECT seq, trigger_id, webhook_url, secret, payload, created, attempts, failed_at, last_error FROM dead_letters"
+        conditions, params = [], []
+        if trigger_id:
+            conditions.append("trigger_id = ?")
+            params.append(trigger_id)
+        if seqs:
+            conditions.append(f"seq IN ({', '.join('?' * len(seqs))})")
+            params.extend(seqs)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY seq LIMIT ?"
+        params.append(limit)
+        columns = ("seq", "trigger_id", "webhook_url", "secret", "payload", "created", "attempts", "failed_at", "last_error")
+        return [dict(zip(columns, row)) for row in self.conn.execute(query, params)]
+
+    def update_dead_letter(self, seq: int, error: str):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE dead_letters SET attempts = attempts + 1, failed_at = ?, last_error = ? WHERE seq = ?",
+                (time.time(), error, seq)
+            )
+
+    def discard_dead_letters(self, seqs):
+        with self.conn:
+            self.conn.executemany("DELETE FROM dead_letters WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def stats(self):
+        return {
+            "outbox": self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0] + len(self.inserts) - len(self.deletes),
+            "dead_letters": self.conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0],
+        }
+
+    def close(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        self.flush()
+        self.sync()
@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+# Background job settings (can be overridden via environment)
+JOBS_CONCURRENCY = int(os.environ.get("PYRO_JOBS_CONCURRENCY", "4"))
+JOBS_TTL = float(os.environ.get("PYRO_JOBS_TTL", "3600"))
+JOBS_MAX = int(os.environ.get("PYRO_JOBS_MAX", "1000"))
+
+FINISHED = ("done", "failed", "cancelled")
+
+# Job the current task is running, so deep code (uploads, downloads, loops) can report progress
+current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class Job:
+    def __init__(self, operation: str):
+        self.id = uuid.uuid4().hex
+        self.operation = operation
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = {"current": 0, "total": None, "unit": None}
+        self.result = None
+        self.error = None
+        self.task = None
+
+    async def report_bytes(self, current: int, total: int):
+        """Pyrogram progress callback (upload/download)"""
+        self.progress = {"current": current, "total": total, "unit": "bytes"}
+
+    def advance(self, count: int = 1, total: int = None):
+        self.progress = {
+            "current": (self.progress["current"] if self.progress["unit"] == "items" else 0) + count,
+            "total": total if total is not None else self.progress["total"],
+            "unit": "items",
+        }
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "operation": self.operation,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs submitted operations as tasks on the shared event loop, at most ``concurrency`` at a time"""
+
+    def __init__(self, concurrency=JOBS_CONCURRENCY, ttl=JOBS_TTL, max_jobs=JOBS_MAX):
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.semaphore = None
+
+    def submit(self, operation: str, run) -> Job:
+        """Schedule ``run()`` (a coroutine factory) as a new job"""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.prune()
+        job = Job(operation)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self.execute(job, run))
+        return job
+
+    async def execute(self, job: Job, run):
+        current_job.set(job)
+        try:
+            async with self.semaphore:
+                job.status = "running"
+                job.started = time.time()
+                result = await run()
+            if isinstance(result, dict) and "error" in result:
+                job.status, job.error = "failed", result["error"]
+            else:
+                job.status, job.result = "done", result
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is not None and job.status not in FINISHED:
+            job.task.cancel()
+            if job.status == "queued":
+                # The task may not have started yet, in which case execute() never records it
+                job.status, job.finished = "cancelled", time.time()
+        return job
+
+    def prune(self):
+        """Forget finished jobs older than ttl, and the oldest finished ones beyond max_jobs"""
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.status in FINISHED and (now - job.finished > self.ttl or len(self.jobs) > self.max_jobs):
+                del self.jobs[job_id]
+
+    def stats(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+
+def job_progress():
+    """Progress callback for the current job, or None outside of jobs"""
+    job = current_job.get()
+    return job.report_bytes if job is not None else None
+
+
+def advance_job(count: int = 1, total: int = None):
+    job = current_job.get()
+    if job is not None:
+        job.advance(count, total)
@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+
+from session_storage import SESSION_DIR
+
+# Upload dedup cache settings (can be overridden via environment)
+MEDIA_CACHE_DB = os.environ.get(
+    "PYRO_MEDIA_CACHE_DB",
+    os.path.join(SESSION_DIR, "media_cache.db") if SESSION_DIR else ":memory:"
+)
+MEDIA_CACHE_MAX = int(os.environ.get("PYRO_MEDIA_CACHE_MAX", "10000"))
+MEDIA_CACHE_TTL = float(os.environ.get("PYRO_MEDIA_CACHE_TTL", str(30 * 24 * 3600)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media
+(
+    account   TEXT NOT NULL,
+    kind      TEXT NOT NULL,
+    digest    TEXT NOT NULL,
+    file_id   TEXT NOT NULL,
+    created   REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (account, kind, digest)
+);
+
+CREATE INDEX IF NOT EXISTS idx_media_last_used ON media (last_used);
+"""
+
+URL_PATTERN = re.compile(r"^https?://")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MediaCache:
+    """Remembers the Telegram file_id that each piece of uploaded media got, per account
+    and media kind (the same bytes sent as a document and as an animation get
+    file_ids that are not interchangeable).
+
+    Media is identified by the SHA-256 of its bytes for local files and
+    streamed uploads, and by the URL for remote files. Entries expire
+    after ``ttl`` seconds and the least recently used ones are evicted
+    beyond ``max_entries``.
+    """
+
+    def __init__(self, path=MEDIA_CACHE_DB, max_entries=MEDIA_CACHE_MAX, ttl=MEDIA_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(media)")]
+        if columns and "kind" not in columns:
+            # Created before entries were keyed by kind; it is only a cache, so start over
+            self.conn.execute("DROP TABLE media")
+        self.conn.executescript(SCHEMA)
+        # (path, size, mtime) -> digest, so unchanged local files are hashed only once
+        self.path_digests = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def digest(self, media) -> str:
+        """Cache key for a path / URL media argument, or None for file_ids and other values"""
+        if not isinstance(media, str):
+            return None
+        if URL_PATTERN.match(media):
+            return "url:" + hashlib.sha256(media.encode()).hexdigest()
+        if not os.path.isfile(media):
+            return None
+        stat = os.stat(media)
+        key = (media, stat.st_size, stat.st_mtime_ns)
+        if key not in self.path_digests:
+            self.path_digests[key] = "sha256:" + await asyncio.to_thread(hash_file, media)
+            if len(self.path_digests) > 1024:
+                self.path_digests.popitem(last=False)
+        return self.path_digests[key]
+
+    def get(self, account: str, kind: str, digest: str):
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT file_id, created FROM media WHERE account = ? AND kind = ? AND digest = ?",
+            (account, kind, digest)
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        with self.conn:
+            self.conn.execute(
+                "UPDATE media SET last_used = ? WHERE account = ? AND kind = ? AND digest = ?",
+                (now, account, kind, digest)
+            )
+        self.hits += 1
+        return row[0]
+
+    def put(self, account: str, kind: str, digest: str, file_id: str):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "REPLACE INTO media (account, kind, digest, file_id, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (account, kind, digest, file_id, now, now)
+            )
+            self.conn.execute("DELETE FROM media WHERE created < ?", (now - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM media WHERE rowid NOT IN "
+                "(SELECT rowid FROM media ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+    def discard(self, account: str, kind: str, digest: str):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM media WHERE account = ? AND kind = ? AND digest = ?",
+                (account, kind, digest)
+            )
+
+    def stats(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+        return {"entries": count, "hits": self.hits, "misses": self.misses}
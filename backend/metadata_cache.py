@@ -0,0 +1,153 @@
+import os
+import time
+import weakref
+from collections import OrderedDict
+
+from pyrogram import raw, utils
+from pyrogram.handlers import RawUpdateHandler
+
+from client_pool import ClientPool, key_account
+
+# Chat metadata cache settings (can be overridden via environment)
+METADATA_CACHE_TTL = float(os.environ.get("PYRO_METADATA_CACHE_TTL", "300"))
+METADATA_CACHE_MAX = int(os.environ.get("PYRO_METADATA_CACHE_MAX", "10000"))
+
+# A group of its own, so it runs next to the trigger listener's handlers
+METADATA_HANDLER_GROUP = 102
+
+# Service messages after which a chat's cached metadata is stale
+CHAT_ACTIONS = (
+    raw.types.MessageActionChatEditTitle,
+    raw.types.MessageActionChatEditPhoto,
+    raw.types.MessageActionChatDeletePhoto,
+    raw.types.MessageActionChatAddUser,
+    raw.types.MessageActionChatDeleteUser,
+    raw.types.MessageActionChatJoinedByLink,
+    raw.types.MessageActionChatJoinedByRequest,
+    raw.types.MessageActionChatMigrateTo,
+    raw.types.MessageActionChannelMigrateFrom,
+)
+
+
+def updated_chat_id(update):
+    """Id of the chat whose title, photo, settings or members ``update`` changes, if any"""
+    if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+        message = update.message
+        if isinstance(message, raw.types.MessageService) and isinstance(message.action, CHAT_ACTIONS):
+            return utils.get_peer_id(message.peer_id)
+        return None
+    if isinstance(update, (raw.types.UpdateChannel, raw.types.UpdateChannelParticipant)):
+        return utils.get_channel_id(update.channel_id)
+    if isinstance(update, raw.types.UpdateChatParticipants):
+        return -update.participants.chat_id
+    if isinstance(update, (raw.types.UpdateChat, raw.types.UpdateChatParticipantAdd,
+                           raw.types.UpdateChatParticipantDelete, raw.types.UpdateChatParticipantAdmin)):
+        return -update.chat_id
+    if isinstance(update, raw.types.UpdateChatDefaultBannedRights):
+        return utils.get_peer_id(update.peer)
+    return None
+
+
+class MetadataCache:
+    """Per-account cache of get_chat, get_chat_member and get_chat_administrators results.
+
+    Entries are keyed by (account, chat_id, kind, ...), expire after ``ttl``
+    seconds and are evicted in LRU order beyond ``max_entries``. A chat's
+    entries are dropped when its pooled client receives an update changing
+    the chat or its members, and all of an account's entries when its client
+    (re)starts or stops, since updates may have been missed in between.
+    """
+
+    def __init__(self, max_entries=METADATA_CACHE_MAX, ttl=METADATA_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires, value)
+        self.entries = OrderedDict()
+        # (account, chat_id) -> keys of that chat's entries
+        self.chats = {}
+        # (account, chat_id) -> loads in flight; chats invalidated during one land
+        # in ``raced`` so the possibly stale result is not stored
+        self.loading = {}
+        self.raced = set()
+        self.watched = weakref.WeakSet()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def fetch(self, key: tuple, load, fresh: bool = False):
+        """Cached value of ``key``, or the result of ``await load()``, which is then cached.
+        With ``fresh`` the cache is not read but still refreshed."""
+        if not fresh:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        self.misses += 1
+        chat = key[:2]
+        self.loading[chat] = self.loading.get(chat, 0) + 1
+        try:
+            value = await load()
+        finally:
+            self.loading[chat] -= 1
+            raced = chat in self.raced
+            if not self.loading[chat]:
+                del self.loading[chat]
+                self.raced.discard(chat)
+        if not raced and not (isinstance(value, dict) and "error" in value):
+            self.put(key, value)
+        return value
+
+    def put(self, key: tuple, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        self.chats.setdefault(key[:2], set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self.discard(next(iter(self.entries)))
+
+    def discard(self, key: tuple):
+        if self.entries.pop(key, None) is None:
+            return
+        keys = self.chats.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.chats[key[:2]]
+
+    def invalidate(self, account: str, chat_id):
+        if (account, chat_id) in self.loading:
+            self.raced.add((account, chat_id))
+        keys = self.chats.pop((account, chat_id), None)
+        if keys:
+            self.invalidations += 1
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def forget_account(self, account: str):
+        for chat in [chat for chat in self.chats if chat[0] == account]:
+            for key in self.chats.pop(chat):
+                self.entries.pop(key, None)
+
+    def watch(self, pool: ClientPool):
+        """Invalidate from the updates of every client in ``pool``"""
+        pool.on_start.append(self.client_started)
+        pool.on_stop.append(self.client_stopped)
+
+    def client_started(self, entry):
+        account = key_account(entry.key)
+        self.forget_account(account)
+        if entry not in self.watched:
+            self.watched.add(entry)
+
+            async def on_raw_update(client, update, users, chats):
+                chat_id = updated_chat_id(update)
+                if chat_id is not None:
+                    self.invalidate(account, chat_id)
+
+            ClientPool.add_handler(entry, RawUpdateHandler(on_raw_update), METADATA_HANDLER_GROUP)
+
+    def client_stopped(self, entry):
+        self.forget_account(key_account(entry.key))
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
@@ -0,0 +1,128 @@
+from bisect import bisect_left
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter; updating it is a single dict operation"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, self.labels, labels, value
+
+
+class Gauge(Counter):
+    """Value that goes up and down (in-flight RPCs and the like)"""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        names = self.labels + ("le",)
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield self.name + "_bucket", names, labels + (bound,), cumulative
+            yield self.name + "_sum", self.labels, labels, total
+            yield self.name + "_count", self.labels, labels, cumulative
+
+
+class Registry:
+    """Metrics updated in place on the hot path, plus collectors that read
+    other components' counters only when /metrics is scraped"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels=()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, collect):
+        """Register ``collect()``, returning metrics computed at scrape time"""
+        self.collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        metrics = list(self.metrics)
+        for collect in self.collectors:
+            metrics.extend(collect())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, label_values, value in metric.samples():
+                lines.append(f"{name}{format_labels(label_names, label_values)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def snapshot(kind, name: str, help: str, values, labels=()):
+    """A metric built at scrape time: ``values`` maps label tuples to numbers, or is a single number"""
+    metric = (Gauge if kind == "gauge" else Counter)(name, help, labels)
+    metric.values = values if isinstance(values, dict) else {(): values}
+    return metric
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter("pyro_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+HTTP_LATENCY = registry.histogram("pyro_http_request_duration_seconds", "HTTP request latency by route", ("route",))
+HTTP_EXCEPTIONS = registry.counter("pyro_http_exceptions_total", "Unhandled exceptions raised by routes, by type", ("type",))
+RPC_IN_FLIGHT = registry.gauge("pyro_rpc_in_flight", "Telegram RPCs currently awaiting a response")
+RPC_ERRORS = registry.counter("pyro_rpc_errors_total", "Failed Telegram RPCs by error type", ("type",))
+CLIENT_STARTS = registry.counter("pyro_client_starts_total", "Pyrogram clients started")
+CLIENT_STOPS = registry.counter("pyro_client_stops_total", "Pyrogram clients stopped")
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from functools import partial
+
+from pyrogram.errors import FloodWait
+
+from webhooks import serialize_update
+
+# Polling trigger settings (can be overridden via environment)
+POLL_INTERVAL = float(os.environ.get("PYRO_POLL_INTERVAL", "60"))
+POLL_MIN_INTERVAL = float(os.environ.get("PYRO_POLL_MIN_INTERVAL", "10"))
+POLL_LIMIT = int(os.environ.get("PYRO_POLL_LIMIT", "100"))
+# Each tick is spread by +/- this fraction of the interval so pollers don't align
+POLL_JITTER = float(os.environ.get("PYRO_POLL_JITTER", "0.1"))
+POLL_MAX_BACKOFF = 64
+
+POLL_METHODS = ("get_chat_history", "search_messages", "get_dialogs", "get_chat_members", "get_chat_members_count")
+
+
+def cursor_key(account: str, method: str, config: dict, webhook_url: str) -> str:
+    """Stable id of a polling trigger, so a re-registered trigger resumes from its stored cursor"""
+    source = json.dumps([account, method, config, webhook_url], sort_keys=True, default=str)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class Poller:
+    """Runs one polling trigger: every ``interval`` seconds fetches what changed
+    since the stored cursor and hands each new item to ``deliver``.
+
+    The first poll of a new trigger only records the cursor, so existing
+    history is not emitted; the cursor is persisted after the items it covers
+    are in the delivery outbox, so restarts never re-emit old items.
+    """
+
+    def __init__(self, trigger, req: dict, pool, store, deliver, method: str, interval=None, config: dict = None):
+        if method not in POLL_METHODS:
+            raise ValueError(f"pollingMethod must be one of: {', '.join(POLL_METHODS)}")
+        config = config or {}
+        if method != "get_dialogs" and not config.get("chatId"):
+            raise ValueError("pollingConfig.chatId is required")
+        chat_id = str(config.get("chatId", "")).strip()
+        self.trigger = trigger
+        self.req = req
+        self.pool = pool
+        self.store = store
+        self.deliver = deliver
+        self.method = method
+        self.interval = max(float(interval or POLL_INTERVAL), POLL_MIN_INTERVAL)
+        self.chat_id = int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id
+        self.limit = int(config.get("limit") or POLL_LIMIT)
+        self.query = config.get("searchQuery") or ""
+        self.key = cursor_key(trigger.account, method, config, trigger.webhook_url)
+        self.state = store.load_cursor(self.key)
+        self.task = None
+        self.polls = 0
+        self.emitted = 0
+        self.errors = 0
+        self.last_poll = None
+        self.last_error = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        # A random first tick spreads pollers registered together across the interval
+        await asyncio.sleep(random.uniform(0, self.interval))
+        backoff = 1
+        while True:
+            try:
+                await self.poll()
+                backoff = 1
+                delay = self.interval
+            except FloodWait as e:
+                self.errors += 1
+                self.last_error = str(e)
+                delay = e.value * backoff
+                backoff = min(backoff * 2, POLL_MAX_BACKOFF)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e) or e.__class__.__name__
+                delay = self.interval * backoff
+                backoff = min(backoff * 2, POLL_MAX_BACKOFF)
+            await asyncio.sleep(delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER))
+
+    async def poll(self):
+        async with self.pool.lease(self.req) as client:
+            items, state = await getattr(self, self.method)(client)
+        for item in items:
+            await self.deliver(self.trigger, {"trigger_id": self.trigger.id, "update_type": self.method, "update": item})
+        self.emitted += len(items)
+        if state != self.state:
+            self.store.save_cursor(self.key, state)
+            self.state = state
+        self.polls += 1
+        self.last_poll = time.time()
+
+    async def new_messages(self, fetch):
+        """Messages newer than the cursor, returned oldest first.
+
+        ``fetch(limit)`` yields messages newest first; once there is a cursor
+        it is read without a limit (Pyrogram pages lazily) until the cursor,
+        so a burst larger than one page between polls is not skipped.
+        """
+        last_id = self.state["last_message_id"] if self.state else None
+        new = []
+        async for message in fetch(limit=1 if last_id is None else 0):
+            if last_id is not None and message.id <= last_id:
+                break
+            new.append(message)
+        if not new:
+            return [], self.state or {"last_message_id": 0}
+        state = {"last_message_id": new[0].id}
+        if last_id is None:
+            return [], state
+        return [serialize_update(message) for message in reversed(new)], state
+
+    async def get_chat_history(self, client):
+        return await self.new_messages(partial(client.get_chat_history, self.chat_id))
+
+    async def search_messages(self, client):
+        return await self.new_messages(partial(client.search_messages, self.chat_id, query=self.query))
+
+    async def get_dialogs(self, client):
+        """Dialogs with a top message newer than the cursor; pinned dialogs come first regardless of date"""
+        last_date = self.state["last_date"] if self.state else None
+        newest = last_date or 0
+        new = []
+        async for dialog in client.get_dialogs(limit=self.limit):
+            top_message = dialog.top_message
+            date = top_message.date.timestamp() if top_message and top_message.date else 0
+            if last_date is None or date > last_date:
+                newest = max(newest, date)
+                if last_date is not None:
+                    new.append(dialog)
+            elif not dialog.is_pinned:
+                break
+            if last_date is None and not dialog.is_pinned:
+                break
+        state = {"last_date": newest}
+        if last_date is None:
+            return [], state
+        return [serialize_update(dialog) for dialog in reversed(new)], state
+
+    async def get_chat_members(self, client):
+        """Members who joined or left since the last poll, detected through a hash of the member id set"""
+        members = {}
+        async for member in client.get_chat_members(self.chat_id):
+            if member.user is not None:
+                members[member.user.id] = member
+        ids = sorted(members)
+        digest = hashlib.sha256(",".join(map(str, ids)).encode()).hexdigest()
+        if self.state is not None and self.state["hash"] == digest:
+            return [], self.state
+        state = {"hash": digest, "ids": ids, "count": len(ids)}
+        if self.state is None:
+            return [], state
+        old = set(self.state["ids"])
+        joined = [members[user_id] for user_id in ids if user_id not in old]
+        left = sorted(old - set(ids))
+        return [{
+            "chat_id": self.chat_id,
+            "joined": [serialize_update(member) for member in joined],
+            "left": left,
+            "count": len(ids),
+            "previous_count": self.state["count"],
+        }], state
+
+    async def get_chat_members_count(self, client):
+        count = await client.get_chat_members_count(self.chat_id)
+        if self.state is not None and self.state["count"] == count:
+            return [], self.state
+        state = {"count": count}
+        if self.state is None:
+            return [], state
+        return [{"chat_id": self.chat_id, "count": count, "previous_count": self.state["count"]}], state
+
+    def to_dict(self):
+        return {
+            "method": self.method,
+            "interval": self.interval,
+            "chat_id": self.chat_id,
+            "polls": self.polls,
+            "emitted": self.emitted,
+            "errors": self.errors,
+            "last_poll": self.last_poll,
+            "last_error": self.last_error,
+        }
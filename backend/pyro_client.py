@@ -0,0 +1,182 @@
+import asyncio
+import inspect
+import math
+from hashlib import md5, sha256
+
+from pyrogram import Client, raw
+from pyrogram.errors import FloodWait
+from pyrogram.session import Session
+
+from jobs import job_progress
+from metrics import RPC_ERRORS, RPC_IN_FLIGHT
+from rate_limit import FLOOD_MAX_RETRIES, FLOOD_MAX_WAIT
+from timing import phase
+
+UPLOAD_PART_SIZE = 512 * 1024
+UPLOAD_BIG_FILE_SIZE = 10 * 1024 * 1024
+
+
+class UploadStream:
+    """Forward-only upload source fed by an async byte iterator (e.g. an HTTP request body).
+
+    Telegram needs the total number of parts up front, so the exact ``size``
+    must be known before the first byte is read.
+    """
+
+    def __init__(self, chunks, size: int, name: str):
+        self.chunks = chunks.__aiter__()
+        self.size = size
+        self.name = name
+        self.buffer = bytearray()
+        self.received = 0
+        self.sha256 = sha256()
+
+    async def read_part(self, part_size: int) -> bytes:
+        while len(self.buffer) < part_size:
+            try:
+                chunk = await self.chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            self.received += len(chunk)
+            self.sha256.update(chunk)
+            self.buffer += chunk
+        part = bytes(self.buffer[:part_size])
+        del self.buffer[:part_size]
+        return part
+
+
+class PyroClient(Client):
+    """Pyrogram client that runs every RPC through its account's scheduler and
+    can also upload straight from an UploadStream"""
+
+    scheduler = None
+
+    async def invoke(self, query, retries: int = Session.MAX_RETRIES, timeout: float = Session.WAIT_TIMEOUT, sleep_threshold: float = None):
+        if self.scheduler is None:
+            return await self.tracked_invoke(query, retries, timeout, sleep_threshold)
+        attempts = 0
+        while True:
+            with phase("rate_limit"):
+                await self.scheduler.wait(query)
+            try:
+                # Always surface FloodWait so the pause applies to the whole account, not just this call
+                return await self.tracked_invoke(query, retries, timeout, sleep_threshold=0)
+            except FloodWait as e:
+                self.scheduler.pause(query, e.value)
+                attempts += 1
+                if e.value > FLOOD_MAX_WAIT or attempts > FLOOD_MAX_RETRIES:
+                    raise
+
+    async def tracked_invoke(self, query, retries: int, timeout: float, sleep_threshold: float):
+        RPC_IN_FLIGHT.inc()
+        try:
+            with phase("rpc"):
+                return await super().invoke(query, retries, timeout, sleep_threshold)
+        except Exception as e:
+            RPC_ERRORS.inc(e.__class__.__name__)
+            raise
+        finally:
+            RPC_IN_FLIGHT.dec()
+
+    async def resolve_peer(self, peer_id):
+        with phase("resolve_peer"):
+            return await super().resolve_peer(peer_id)
+
+    async def get_file(self, file_id, file_size: int = 0, limit: int = 0, offset: int = 0, progress=None, progress_args: tuple = ()):
+        # Report download progress to the background job running this call, if any
+        progress = progress or job_progress()
+        chunks = super().get_file(file_id, file_size, limit, offset, progress, progress_args).__aiter__()
+        while True:
+            # Only time fetching, not the consumer working on each chunk
+            with phase("download"):
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield chunk
+
+    async def save_file(self, path, file_id: int = None, file_part: int = 0, progress=None, progress_args: tuple = ()):
+        progress = progress or job_progress()
+        with phase("upload"):
+            if not isinstance(path, UploadStream):
+                return await super().save_file(path, file_id, file_part, progress, progress_args)
+            if file_id is not None:
+                # FilePartMissing retries need to rewind, which a request body cannot do
+                raise ValueError("Streamed uploads cannot re-send a missing part")
+            async with self.save_file_semaphore:
+                return await self.save_stream(path, progress, progress_args)
+
+    async def save_stream(self, stream: UploadStream, progress=None, progress_args: tuple = ()):
+        if stream.size <= 0:
+            raise ValueError("File size equals to 0 B")
+        file_size_limit_mib = 4000 if self.me.is_premium else 2000
+        if stream.size > file_size_limit_mib * 1024 * 1024:
+            raise ValueError(f"Can't upload files bigger than {file_size_limit_mib} MiB")
+
+        file_total_parts = math.ceil(stream.size / UPLOAD_PART_SIZE)
+        is_big = stream.size > UPLOAD_BIG_FILE_SIZE
+        file_id = self.rnd_id()
+        md5_sum = None if is_big else md5()
+        errors = []
+
+        session = Session(
+            self, await self.storage.dc_id(), await self.storage.auth_key(),
+            await self.storage.test_mode(), is_media=True
+        )
+        # A one-slot queue gives back-pressure: the body is only read as fast as parts are uploaded
+        queue = asyncio.Queue(1)
+
+        async def worker():
+            while True:
+                rpc = await queue.get()
+                if rpc is None:
+                    return
+                try:
+                    await session.invoke(rpc)
+                except Exception as e:
+                    errors.append(e)
+
+        workers = [asyncio.create_task(worker()) for _ in range(4 if is_big else 1)]
+        try:
+            await session.start()
+            file_part = 0
+            while not errors:
+                chunk = await stream.read_part(UPLOAD_PART_SIZE)
+                if not chunk:
+                    break
+                if is_big:
+                    rpc = raw.functions.upload.SaveBigFilePart(
+                        file_id=file_id,
+                        file_part=file_part,
+                        file_total_parts=file_total_parts,
+                        bytes=chunk
+                    )
+                else:
+                    rpc = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=file_part, bytes=chunk)
+                    md5_sum.update(chunk)
+                await queue.put(rpc)
+                file_part += 1
+
+                if progress:
+                    result = progress(min(file_part * UPLOAD_PART_SIZE, stream.size), stream.size, *progress_args)
+                    if inspect.isawaitable(result):
+                        await result
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            await session.stop()
+
+        if errors:
+            raise errors[0]
+        if stream.received != stream.size:
+            raise ValueError(f"Expected {stream.size} bytes, received {stream.received}")
+
+        if is_big:
+            return raw.types.InputFileBig(id=file_id, parts=file_total_parts, name=stream.name)
+        return raw.types.InputFile(
+            id=file_id,
+            parts=file_total_parts,
+            name=stream.name,
+            md5_checksum=md5_sum.hexdigest()
+        )
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import time
+import uuid
+
+import aiohttp
+from pyrogram import enums, raw
+from pyrogram.handlers import (
+    CallbackQueryHandler,
+    ChatJoinRequestHandler,
+    ChatMemberUpdatedHandler,
+    ChosenInlineResultHandler,
+    DeletedMessagesHandler,
+    EditedMessageHandler,
+    InlineQueryHandler,
+    MessageHandler,
+    PollHandler,
+    RawUpdateHandler,
+    UserStatusHandler,
+)
+
+from client_pool import account_id
+from delivery_store import DeliveryStore
+from pollers import Poller
+from trigger_filters import UPDATE_TYPE_BITS, CompiledFilter, TriggerIndex, split_list, update_fields
+from webhooks import (
+    TRIGGER_OVERFLOW,
+    TRIGGER_QUEUE_MAX,
+    WEBHOOK_BATCH_MAX,
+    WEBHOOK_LINGER_MS,
+    TriggerDelivery,
+    WebhookSessions,
+    serialize_update,
+    webhook_headers,
+)
+
+# Handler groups used by triggers. Pyrogram runs at most one handler per group,
+# so the catch-all raw handler gets a group of its own.
+HANDLER_GROUP = 100
+RAW_HANDLER_GROUP = 101
+
+RAW_UPDATE_TYPES = {
+    raw.types.UpdateMessagePollVote: "poll_answer",
+    raw.types.UpdateUserTyping: "user_typing",
+    raw.types.UpdateChatUserTyping: "chat_action",
+    raw.types.UpdateChannelUserTyping: "chat_action",
+    raw.types.UpdateMessageReactions: "reaction",
+}
+if hasattr(raw.types, "UpdateStory"):
+    RAW_UPDATE_TYPES[raw.types.UpdateStory] = "story"
+
+
+class Trigger:
+    def __init__(self, account: str, update_types: list, filters: dict, webhook_url: str, secret: str = None):
+        self.id = uuid.uuid4().hex
+        self.account = account
+        self.filter = CompiledFilter(update_types, filters)
+        self.filters = filters
+        self.webhook_url = webhook_url
+        self.secret = secret
+        self.created = time.time()
+        self.matched = 0
+        self.delivered = 0
+        self.failed = 0
+        self.last_error = None
+        self.delivery = None
+        self.poller = None
+
+    def counts(self) -> dict:
+        delivery = self.delivery.stats()
+        return {
+            "matched": self.matched,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dead_lettered": delivery["dead_lettered"],
+            "dropped": delivery["dropped"],
+        }
+
+    def to_dict(self):
+        return {
+            "trigger_id": self.id,
+            "update_types": sorted(self.filter.update_types),
+            "filters": self.filters,
+            "webhook_url": self.webhook_url,
+            "created": self.created,
+            "matched": self.matched,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "last_error": self.last_error,
+            **self.delivery.stats(),
+            "polling": self.poller.to_dict() if self.poller is not None else None,
+        }
+
+
+class AccountListener:
+    """One pinned client per account: receives each update once and fans it out
+    to every trigger registered for the account"""
+
+    def __init__(self, service, account: str):
+        self.service = service
+        self.account = account
+        self.triggers = {}
+        self.index = TriggerIndex()
+        self.entry = None
+        self.handlers = [
+            (MessageHandler(self.on_message), HANDLER_GROUP),
+            (EditedMessageHandler(self.on_edited_message), HANDLER_GROUP),
+            (DeletedMessagesHandler(self.on_update("deleted_messages")), HANDLER_GROUP),
+            (CallbackQueryHandler(self.on_update("callback_query")), HANDLER_GROUP),
+            (InlineQueryHandler(self.on_update("inline_query")), HANDLER_GROUP),
+            (ChosenInlineResultHandler(self.on_update("chosen_inline_result")), HANDLER_GROUP),
+            (UserStatusHandler(self.on_update("user_status")), HANDLER_GROUP),
+            (PollHandler(self.on_update("poll")), HANDLER_GROUP),
+            (ChatMemberUpdatedHandler(self.on_update("chat_member")), HANDLER_GROUP),
+            (ChatJoinRequestHandler(self.on_update("chat_join_request")), HANDLER_GROUP),
+            (RawUpdateHandler(self.on_raw_update), RAW_HANDLER_GROUP),
+        ]
+
+    async def start(self, req):
+        # The lease is held for the listener's lifetime, so the pool never evicts or reaps the client
+        self.entry = await self.service.pool.acquire(req)
+        for handler, group in self.handlers:
+            self.service.pool.add_handler(self.entry, handler, group)
+
+    def stop(self):
+        for handler, group in self.handlers:
+            self.service.pool.remove_handler(self.entry, handler, group)
+        self.service.pool.release(self.entry)
+
+    def on_update(self, update_type: str):
+        async def callback(client, update):
+            await self.dispatch(update_type, update)
+        return callback
+
+    async def on_message(self, client, message):
+        await self.dispatch("channel_post" if message.chat and message.chat.type == enums.ChatType.CHANNEL else "message", message)
+
+    async def on_edited_message(self, client, message):
+        await self.dispatch("edited_channel_post" if message.chat and message.chat.type == enums.ChatType.CHANNEL else "edited_message", message)
+
+    async def on_raw_update(self, client, update, users, chats):
+        update_type = RAW_UPDATE_TYPES.get(type(update))
+        if update_type is not None:
+            await self.dispatch(update_type, update)
+
+    def add(self, trigger: Trigger):
+        self.triggers[trigger.id] = trigger
+        self.index.add(trigger)
+
+    def remove(self, trigger: Trigger):
+        del self.triggers[trigger.id]
+        self.index.remove(trigger)
+
+    async def dispatch(self, update_type: str, update):
+        if not self.index.wants(update_type):
+            return
+        fields = update_fields(update_type, update)
+        update_bit = UPDATE_TYPE_BITS[update_type]
+        payload = None
+        for trigger in self.index.candidates(update_type, fields["chat_id"]):
+            if not trigger.filter.match(update_bit, fields):
+                continue
+            trigger.matched += 1
+            if payload is None:
+                # Serialized once, however many triggers match
+                payload = serialize_update(update)
+            await self.service.deliver(trigger, {"trigger_id": trigger.id, "update_type": update_type, "update": payload})
+
+
+class PyrogramTriggerService:
+    """Registry of webhook triggers: update triggers share one listener per
+    account, polling triggers each run their own Poller on pooled clients"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.triggers = {}
+        # Removed triggers whose delivery is still shutting down, then their counts in ``retired``
+        self.closing = {}
+        self.retired = {"matched": 0, "delivered": 0, "failed": 0, "dead_lettered": 0, "dropped": 0}
+        self.listeners = {}
+        # The global lock only guards the registries; starting an account's
+        # listener (connect, login) holds just that account's lock
+        self.lock = asyncio.Lock()
+        self.account_locks = {}
+        self.stopped = False
+        self.sessions = WebhookSessions()
+        self.store = DeliveryStore()
+
+    async def add_trigger(self, req: dict, secret: str = None) -> Trigger:
+        polling_method = req.get("pollingMethod")
+        update_types = [] if polling_method else split_list(req.get("updateTypes")) or ["message"]
+        if not req.get("webhookUrl"):
+            raise ValueError("webhookUrl is required")
+
+        account = account_id(req)
+        trigger = Trigger(account, update_types, req.get("filters") or {}, req["webhookUrl"], secret)
+        trigger.delivery = TriggerDelivery(
+            trigger,
+            self.sessions,
+            self.store,
+            batch_max=int(req.get("batchSize") or WEBHOOK_BATCH_MAX),
+            linger_ms=float(req.get("batchLingerMs") or WEBHOOK_LINGER_MS),
+            queue_max=int(req.get("queueSize") or TRIGGER_QUEUE_MAX),
+            overflow=req.get("overflow") or TRIGGER_OVERFLOW,
+        )
+        if polling_method:
+            trigger.poller = Poller(
+                trigger, req, self.pool, self.store, self.deliver,
+                polling_method, req.get("pollingInterval"), req.get("pollingConfig") or {}
+            )
+            async with self.lock:
+                self.triggers[trigger.id] = trigger
+            trigger.poller.start()
+            return trigger
+
+        async with self.account_locks.setdefault(account, asyncio.Lock()):
+            async with self.lock:
+                listener = self.listeners.get(account)
+                if listener is not None:
+                    listener.add(trigger)
+                    self.triggers[trigger.id] = trigger
+                    return trigger
+            listener = AccountListener(self, account)
+            await listener.start(req)
+            async with self.lock:
+                if self.stopped:
+                    listener.stop()
+                    raise ValueError("Trigger service is stopped")
+                self.listeners[account] = listener
+                listener.add(trigger)
+                self.triggers[trigger.id] = trigger
+        return trigger
+
+    async def remove_trigger(self, trigger_id: str):
+        async with self.lock:
+            trigger = self.triggers.pop(trigger_id, None)
+            if trigger is None:
+                return None
+            self.closing[trigger.id] = trigger
+            if trigger.poller is None:
+                listener = self.listeners[trigger.account]
+                listener.remove(trigger)
+                if not listener.triggers:
+                    # Last trigger of the account: unpin the client so the pool can reap it
+                    listener.stop()
+                    del self.listeners[trigger.account]
+        await self.close_trigger(trigger)
+        return trigger
+
+    async def close_trigger(self, trigger: Trigger):
+        if trigger.poller is not None:
+            await trigger.poller.stop()
+        await trigger.delivery.close()
+        for name, count in trigger.counts().items():
+            self.retired[name] += count
+        del self.closing[trigger.id]
+
+    def totals(self) -> dict:
+        """Counts over every trigger since startup, removed ones included, so they never go down"""
+        totals = dict(self.retired)
+        for trigger in (*self.triggers.values(), *self.closing.values()):
+            for name, count in trigger.counts().items():
+                totals[name] += count
+        return totals
+
+    def list_triggers(self):
+        return [trigger.to_dict() for trigger in self.triggers.values()]
+
+    async def deliver(self, trigger: Trigger, payload: dict):
+        # Waits only for triggers with the "block" overflow policy and a full queue
+        await trigger.delivery.put(payload)
+
+    def dead_letters(self, trigger_id: str = None, limit: int = 100) -> list:
+        letters = self.store.dead_letters(trigger_id, limit)
+        for letter in letters:
+            del letter["secret"]
+            letter["payload"] = json.loads(letter["payload"])
+        return letters
+
+    async def replay_dead_letters(self, seqs: list = None, trigger_id: str = None, limit: int = 100) -> list:
+        """Re-deliver dead letters: through the trigger's queue while it is registered, else POSTed once directly"""
+        results = []
+        for letter in self.store.dead_letters(trigger_id, limit, seqs):
+            seq = letter["seq"]
+            trigger = self.triggers.get(letter["trigger_id"])
+            if trigger is not None:
+                self.store.discard_dead_letters([seq])
+                await trigger.delivery.put_json(letter["payload"])
+                results.append({"seq": seq, "status": "queued"})
+                continue
+            try:
+                await self.sessions.post(letter["webhook_url"], letter["payload"].encode(), webhook_headers(letter["secret"]))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or e.__class__.__name__
+                self.store.update_dead_letter(seq, error)
+                results.append({"seq": seq, "status": "failed", "error": error})
+                continue
+            self.store.discard_dead_letters([seq])
+            results.append({"seq": seq, "status": "delivered"})
+        return results
+
+    async def stop(self):
+        async with self.lock:
+            self.stopped = True
+            for listener in self.listeners.values():
+                listener.stop()
+            self.listeners.clear()
+            triggers = list(self.triggers.values())
+            self.closing.update(self.triggers)
+            self.triggers.clear()
+        for trigger in triggers:
+            await self.close_trigger(trigger)
+        await self.sessions.close()
+        self.store.close()
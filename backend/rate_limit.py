@@ -0,0 +1,131 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+
+# Send rate limits (can be overridden via environment). Defaults follow
+# Telegram's published bot limits: ~30 messages/s overall, 1 message/s per
+# private chat and 20 messages/min per group or channel.
+RATE_GLOBAL = float(os.environ.get("PYRO_RATE_GLOBAL", "30"))
+RATE_GLOBAL_BURST = float(os.environ.get("PYRO_RATE_GLOBAL_BURST", "30"))
+RATE_PER_CHAT = float(os.environ.get("PYRO_RATE_PER_CHAT", "1"))
+RATE_PER_CHAT_BURST = float(os.environ.get("PYRO_RATE_PER_CHAT_BURST", "3"))
+RATE_PER_GROUP = float(os.environ.get("PYRO_RATE_PER_GROUP", str(20 / 60)))
+RATE_PER_GROUP_BURST = float(os.environ.get("PYRO_RATE_PER_GROUP_BURST", "5"))
+# FloodWait handling: sleep and retry waits up to this long, then give up
+FLOOD_MAX_WAIT = float(os.environ.get("PYRO_FLOOD_MAX_WAIT", "120"))
+FLOOD_MAX_RETRIES = int(os.environ.get("PYRO_FLOOD_MAX_RETRIES", "3"))
+
+CHAT_BUCKETS_MAX = 10000
+
+SEND_FUNCTIONS = (
+    raw.functions.messages.SendMessage,
+    raw.functions.messages.SendMedia,
+    raw.functions.messages.SendMultiMedia,
+    raw.functions.messages.ForwardMessages,
+    raw.functions.messages.SendInlineBotResult,
+)
+
+
+class TokenBucket:
+    """Token bucket where callers reserve a token and sleep off the returned delay (FIFO, lock free)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+def unwrap_query(query):
+    while isinstance(query, (raw.functions.InvokeWithoutUpdates, raw.functions.InvokeWithTakeout)):
+        query = query.query
+    return query
+
+
+def target_peer(query):
+    """(chat key, is_group) for the chat a send RPC targets"""
+    peer = getattr(query, "to_peer", None) or getattr(query, "peer", None)
+    if isinstance(peer, raw.types.InputPeerUser):
+        return f"user:{peer.user_id}", False
+    if isinstance(peer, raw.types.InputPeerChat):
+        return f"chat:{peer.chat_id}", True
+    if isinstance(peer, raw.types.InputPeerChannel):
+        return f"channel:{peer.channel_id}", True
+    return "self", False
+
+
+class AccountScheduler:
+    """Per-account send scheduler: token buckets for global and per-chat send
+    rates, plus pauses imposed by FloodWait errors.
+
+    Callers are queued (they sleep) rather than rejected.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(RATE_GLOBAL, RATE_GLOBAL_BURST)
+        self.chat_buckets = OrderedDict()
+        self.paused_until = {}
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+
+    def chat_bucket(self, key: str, is_group: bool) -> TokenBucket:
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            if is_group:
+                bucket = TokenBucket(RATE_PER_GROUP, RATE_PER_GROUP_BURST)
+            else:
+                bucket = TokenBucket(RATE_PER_CHAT, RATE_PER_CHAT_BURST)
+            self.chat_buckets[key] = bucket
+            if len(self.chat_buckets) > CHAT_BUCKETS_MAX:
+                self.chat_buckets.popitem(last=False)
+        else:
+            self.chat_buckets.move_to_end(key)
+        return bucket
+
+    @staticmethod
+    def limit_key(query) -> str:
+        # All sends share Telegram's flood limits; other methods are limited individually
+        return "send" if isinstance(query, SEND_FUNCTIONS) else query.QUALNAME
+
+    async def wait(self, query):
+        """Sleep until ``query`` may be sent under the rate limits and any FloodWait pause.
+        Raises FloodWait right away if the pause has longer left than FLOOD_MAX_WAIT."""
+        query = unwrap_query(query)
+        delay = self.paused_until.get(self.limit_key(query), 0) - time.monotonic()
+        if delay > FLOOD_MAX_WAIT:
+            raise FloodWait(value=math.ceil(delay))
+        if isinstance(query, SEND_FUNCTIONS):
+            key, is_group = target_peer(query)
+            delay = max(delay, self.global_bucket.reserve(), self.chat_bucket(key, is_group).reserve())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, query, seconds: float):
+        """Record a FloodWait: hold back every query sharing ``query``'s limit for ``seconds``"""
+        key = self.limit_key(unwrap_query(query))
+        self.paused_until[key] = max(self.paused_until.get(key, 0), time.monotonic() + seconds)
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+
+
+schedulers = {}
+
+
+def get_scheduler(account: str) -> AccountScheduler:
+    """Scheduler shared by every client of ``account``, surviving client restarts"""
+    scheduler = schedulers.get(account)
+    if scheduler is None:
+        scheduler = schedulers[account] = AccountScheduler()
+    return scheduler
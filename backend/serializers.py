@@ -0,0 +1,173 @@
+import json
+from datetime import datetime
+from enum import Enum
+from functools import lru_cache
+from operator import attrgetter
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+def dumps(value) -> bytes:
+    """Compact JSON; datetimes as ISO 8601, Pyrogram enums by value"""
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """Encodes with dumps(), skipping FastAPI's generic jsonable_encoder pass"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def related(attr: str, kind: str):
+    """Extractor of a nested object, serialized with the default fields of ``kind``"""
+    get = attrgetter(attr)
+
+    def extract(obj):
+        value = get(obj)
+        return None if value is None else serialize(kind, value)
+    return extract
+
+
+def related_id(attr: str):
+    get = attrgetter(attr)
+
+    def extract(obj):
+        value = get(obj)
+        return None if value is None else value.id
+    return extract
+
+
+def related_attr(attr: str, name: str):
+    get = attrgetter(attr)
+
+    def extract(obj):
+        value = get(obj)
+        return None if value is None else getattr(value, name, None)
+    return extract
+
+
+def media_file_id(message):
+    media = message.media
+    if media is None:
+        return None
+    return getattr(getattr(message, media.value, None), "file_id", None)
+
+
+def entities(attr: str):
+    get = attrgetter(attr)
+
+    def extract(message):
+        return [
+            {"type": e.type, "offset": e.offset, "length": e.length, "url": e.url, "user_id": e.user.id if e.user else None}
+            for e in get(message) or ()
+        ]
+    return extract
+
+
+def plain(*names: str) -> dict:
+    return {name: attrgetter(name) for name in names}
+
+
+# Field name -> extractor, per serializable type
+EXTRACTORS = {
+    "message": {
+        **plain("id", "date", "edit_date", "text", "caption", "media", "service", "media_group_id",
+                "reply_to_message_id", "reply_to_top_message_id", "forward_from_message_id", "forward_sender_name",
+                "forward_signature", "forward_date", "views", "forwards", "outgoing", "mentioned", "scheduled",
+                "author_signature", "has_protected_content", "has_media_spoiler"),
+        "chat_id": related_id("chat"),
+        "chat": related("chat", "chat"),
+        "from_user_id": related_id("from_user"),
+        "from_user": related("from_user", "user"),
+        "sender_chat_id": related_id("sender_chat"),
+        "forward_from_id": related_id("forward_from"),
+        "forward_from_chat_id": related_id("forward_from_chat"),
+        "via_bot_id": related_id("via_bot"),
+        "file_id": media_file_id,
+        "entities": entities("entities"),
+        "caption_entities": entities("caption_entities"),
+    },
+    "chat": {
+        **plain("id", "type", "title", "username", "first_name", "last_name", "is_verified", "is_restricted",
+                "is_creator", "is_scam", "is_fake", "is_support", "bio", "description", "dc_id",
+                "has_protected_content", "invite_link", "members_count"),
+        "linked_chat_id": related_id("linked_chat"),
+    },
+    "user": plain(
+        "id", "first_name", "last_name", "username", "is_self", "is_contact", "is_mutual_contact", "is_deleted",
+        "is_bot", "is_verified", "is_restricted", "is_scam", "is_fake", "is_support", "is_premium", "status",
+        "last_online_date", "next_offline_date", "language_code", "dc_id", "phone_number"
+    ),
+    "member": {
+        **plain("status", "custom_title", "until_date", "joined_date", "is_member", "can_be_edited"),
+        "user_id": related_id("user"),
+        "username": related_attr("user", "username"),
+        "first_name": related_attr("user", "first_name"),
+        "last_name": related_attr("user", "last_name"),
+        "is_bot": related_attr("user", "is_bot"),
+        "user": related("user", "user"),
+        "chat_id": related_id("chat"),
+        "invited_by_id": related_id("invited_by"),
+        "promoted_by_id": related_id("promoted_by"),
+        "restricted_by_id": related_id("restricted_by"),
+    },
+}
+
+# What the endpoints returned before projections existed
+DEFAULT_FIELDS = {
+    "message": ("id", "text", "date"),
+    "chat": ("id", "title", "type", "username"),
+    "user": ("id", "first_name", "username"),
+    "member": ("user_id", "status", "username"),
+}
+
+
+def parse_fields(fields) -> tuple:
+    """``fields`` as a list or comma separated string; empty means the defaults"""
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return tuple(field.strip() for field in fields or () if field.strip())
+
+
+@lru_cache(maxsize=256)
+def projection(kind: str, fields: tuple) -> tuple:
+    """(name, extractor) pairs for ``fields`` of ``kind``; "*" selects every field"""
+    extractors = EXTRACTORS[kind]
+    if not fields:
+        fields = DEFAULT_FIELDS[kind]
+    elif "*" in fields:
+        fields = tuple(extractors)
+    unknown = [field for field in fields if field not in extractors]
+    if unknown:
+        raise ValueError(f"Unknown {kind} fields: {', '.join(unknown)}. Available: {', '.join(extractors)}")
+    return tuple((field, extractors[field]) for field in fields)
+
+
+def serializer(kind: str, fields=None):
+    """Function turning a Pyrogram object into a dict of the requested fields.
+    Raises ValueError for unknown fields."""
+    pairs = projection(kind, parse_fields(fields))
+
+    def serialize_one(obj) -> dict:
+        return {name: extract(obj) for name, extract in pairs}
+    return serialize_one
+
+
+def serialize(kind: str, obj, fields=None) -> dict:
+    return serializer(kind, fields)(obj)
@@ -0,0 +1,73 @@
+import os
+from pathlib import Path
+
+from pyrogram.storage import FileStorage, MemoryStorage
+
+# Durable session storage settings (can be overridden via environment)
+SESSION_DIR = os.environ.get("PYRO_SESSION_DIR", "")
+PEER_CACHE_MAX = int(os.environ.get("PYRO_PEER_CACHE_MAX", "50000"))
+PEER_COMPACT_INTERVAL = float(os.environ.get("PYRO_PEER_COMPACT_INTERVAL", "600"))
+
+SESSION_FIELDS = ("dc_id", "api_id", "test_mode", "auth_key", "user_id", "is_bot")
+
+
+class PersistentStorage(FileStorage):
+    """SQLite session file (auth key, DC and peers) that survives requests and restarts.
+
+    A fresh file is seeded from the session string, if one is given, so
+    user sessions keep their auth key while the peers table fills up over
+    time. The peers table is trimmed to the most recently updated
+    ``peer_cache_max`` rows by ``compact``.
+    """
+
+    def __init__(self, name: str, workdir: Path, session_string: str = None, peer_cache_max: int = PEER_CACHE_MAX):
+        super().__init__(name, workdir)
+
+        self.session_string = session_string
+        self.peer_cache_max = peer_cache_max
+
+    async def open(self):
+        fresh = not self.database.is_file()
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+
+        await super().open()
+
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        if fresh and self.session_string:
+            await self.import_session_string()
+
+    async def import_session_string(self):
+        # Let Pyrogram decode the string (old and new formats) and copy the result over
+        source = MemoryStorage(self.name, self.session_string)
+        await source.open()
+        try:
+            for field in SESSION_FIELDS:
+                await getattr(self, field)(await getattr(source, field)())
+            await self.date(0)
+        finally:
+            await source.close()
+
+    async def update_peers(self, peers):
+        await super().update_peers(peers)
+        # Commit right away: pooled clients may live for days between saves
+        self.conn.commit()
+
+    def compact(self):
+        """Drop the least recently updated peers beyond the cache limit and checkpoint the WAL"""
+        if self.conn is None:
+            return
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM peers WHERE id NOT IN "
+                "(SELECT id FROM peers ORDER BY last_update_on DESC LIMIT ?)",
+                (self.peer_cache_max,)
+            )
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def session_name(key) -> str:
+    """File-safe session name derived from a pool key"""
+    api_id, kind, digest = key
+    return f"{kind}_{api_id}_{digest[:32]}"
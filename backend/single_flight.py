@@ -0,0 +1,33 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesces concurrent identical reads: while a call for a key is in
+    flight, callers with the same key wait for its result (or exception)
+    instead of issuing their own RPC.
+
+    The call runs as its own task, so a caller that goes away (client
+    disconnect, timeout) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: tuple, call):
+        task = self.calls.get(key)
+        if task is None:
+            self.executed += 1
+            task = self.calls[key] = asyncio.ensure_future(call())
+            task.add_done_callback(lambda done: self.finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def finished(self, key: tuple, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            # Retrieved here so it is not reported as unhandled when every caller left
+            task.exception()
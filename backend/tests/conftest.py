@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests never touch the on-disk delivery store
+os.environ.setdefault("PYRO_DELIVERY_DB", ":memory:")
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from client_pool import ClientPool
+
+CREDENTIALS = {"api_id": 1, "api_hash": "hash", "session_string": "session"}
+
+
+class Client:
+    def __init__(self):
+        self.is_connected = None
+        self.is_initialized = None
+        self.stopped = False
+
+    async def start(self):
+        self.is_connected = self.is_initialized = True
+
+    async def stop(self):
+        self.is_connected = self.is_initialized = False
+        self.stopped = True
+
+    def add_handler(self, handler, group=0):
+        pass
+
+
+class Pool(ClientPool):
+    def new_client(self, api_id, api_hash, session_string=None, bot_token=None):
+        return Client()
+
+
+async def fail_lease(pool, error):
+    with pytest.raises(type(error)):
+        async with pool.lease(CREDENTIALS):
+            raise error
+
+
+def test_timeout_does_not_rebuild_a_shared_client():
+    async def main():
+        pool = Pool(session_dir=None)
+        async with pool.lease(CREDENTIALS) as pinned:
+            await fail_lease(pool, asyncio.TimeoutError())
+            await fail_lease(pool, ConnectionError())
+            async with pool.lease(CREDENTIALS) as client:
+                assert client is pinned and not pinned.stopped
+        await pool.close()
+    asyncio.run(main())
+
+
+def test_disconnected_client_is_rebuilt():
+    async def main():
+        pool = Pool(session_dir=None)
+        async with pool.lease(CREDENTIALS) as pinned:
+            pinned.is_connected = False
+            await fail_lease(pool, ConnectionError())
+            async with pool.lease(CREDENTIALS) as client:
+                assert client is not pinned and pinned.stopped
+        await pool.close()
+    asyncio.run(main())
+
+
+def test_connection_error_rebuilds_an_unshared_client():
+    async def main():
+        pool = Pool(session_dir=None)
+        async with pool.lease(CREDENTIALS) as first:
+            pass
+        await fail_lease(pool, ConnectionError())
+        async with pool.lease(CREDENTIALS) as client:
+            assert client is not first
+        await pool.close()
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+import asyncio
+
+from pyrogram_service import PyrogramTriggerService
+
+
+class Pool:
+    """Pool whose logins for ``slow`` api_ids wait until ``login`` is set"""
+
+    def __init__(self, slow):
+        self.slow = slow
+        self.login = asyncio.Event()
+
+    async def acquire(self, req):
+        if req["api_id"] in self.slow:
+            await self.login.wait()
+        return object()
+
+    def release(self, entry):
+        pass
+
+    @staticmethod
+    def add_handler(entry, handler, group=0):
+        pass
+
+    @staticmethod
+    def remove_handler(entry, handler, group=0):
+        pass
+
+
+def trigger_request(api_id):
+    return {"api_id": api_id, "api_hash": "hash", "bot_token": f"{api_id}:token", "webhookUrl": "http://webhook.invalid/"}
+
+
+def test_slow_login_blocks_only_its_own_account():
+    async def main():
+        pool = Pool(slow={1})
+        service = PyrogramTriggerService(pool)
+        slow = asyncio.create_task(service.add_trigger(trigger_request(1)))
+        await asyncio.sleep(0)
+        fast = await asyncio.wait_for(service.add_trigger(trigger_request(2)), 1)
+        assert await asyncio.wait_for(service.remove_trigger(fast.id), 1) is fast
+        assert not slow.done()
+
+        pool.login.set()
+        first = await slow
+        second = await service.add_trigger(trigger_request(1))
+        assert len(service.listeners) == 1
+        assert service.listeners[first.account].triggers.keys() == {first.id, second.id}
+        await service.stop()
+    asyncio.run(main())
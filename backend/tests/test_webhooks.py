@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from delivery_store import DeliveryStore
+from webhooks import TriggerDelivery
+
+
+class Trigger:
+    id = "trigger"
+    webhook_url = "http://webhook.invalid/"
+    secret = None
+    failed = 0
+    delivered = 0
+    last_error = None
+
+
+class Sessions:
+    def __init__(self):
+        self.bodies = []
+
+    async def post(self, url, body, headers):
+        await asyncio.sleep(0)
+        self.bodies.append(json.loads(body))
+
+
+async def deliver_all(count, batch_max, queue_max):
+    store = DeliveryStore(":memory:")
+    sessions = Sessions()
+    delivery = TriggerDelivery(Trigger(), sessions, store, batch_max=batch_max, linger_ms=0,
+                               queue_max=queue_max, overflow="spill")
+    for i in range(count):
+        await delivery.put({"id": i})
+    for _ in range(1000):
+        if not delivery.stats()["depth"] and not delivery.sending:
+            break
+        await asyncio.sleep(0)
+    stats = delivery.stats()
+    store.flush()
+    left = store.load(Trigger.id, 0, count)
+    await delivery.close()
+    store.close()
+    delivered = [update["id"] for body in sessions.bodies for update in (body if isinstance(body, list) else [body])]
+    return delivered, stats, left
+
+
+def test_spill_with_queue_smaller_than_batch_delivers_everything():
+    delivered, stats, left = asyncio.run(deliver_all(30, batch_max=4, queue_max=3))
+    assert delivered == list(range(30))
+    assert stats["depth"] == stats["spilled"] == 0
+    assert left == []
+
+
+def test_spill_with_batch_smaller_than_queue_delivers_everything():
+    delivered, stats, left = asyncio.run(deliver_all(50, batch_max=4, queue_max=10))
+    assert delivered == list(range(50))
+    assert left == []
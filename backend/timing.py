@@ -0,0 +1,54 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Phase timings of the request the current task is serving, None outside of requests
+current_timings = contextvars.ContextVar("current_timings", default=None)
+
+
+class Timings:
+    """Accumulated duration and count per phase; phases may nest (resolve_peer includes its rpc)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name: str, seconds: float):
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def header(self) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        parts = [
+            f'{name};dur={seconds * 1000:.1f};desc="{count}x"'
+            for name, (seconds, count) in self.phases.items()
+        ]
+        parts.append(f"total;dur={self.total() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        return {
+            "phases": {name: {"ms": round(seconds * 1000, 3), "count": count} for name, (seconds, count) in self.phases.items()},
+            "total_ms": round(self.total() * 1000, 3),
+        }
+
+
+@contextmanager
+def phase(name: str):
+    """Time the block as ``name`` in the current request's timings, if any"""
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
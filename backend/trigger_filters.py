@@ -0,0 +1,164 @@
+import re
+
+from pyrogram import enums, raw, utils
+
+UPDATE_TYPES = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "inline_query", "callback_query", "chosen_inline_result", "user_status",
+    "poll", "poll_answer", "chat_member", "chat_join_request", "deleted_messages",
+    "user_typing", "chat_action", "reaction", "story",
+)
+MESSAGE_UPDATE_TYPES = ("message", "edited_message", "channel_post", "edited_channel_post")
+
+# One bit per update type and per media type, so type filters are a single AND
+UPDATE_TYPE_BITS = {update_type: 1 << i for i, update_type in enumerate(UPDATE_TYPES)}
+MEDIA_TYPE_BITS = {media.value: 1 << i for i, media in enumerate(enums.MessageMediaType)}
+
+
+def split_list(value) -> list:
+    """Accept both JSON arrays and the node's comma separated strings"""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def parse_command(text: str):
+    """``start`` for "/start@my_bot arg", None for text that is not a command"""
+    if not text or text[0] != "/":
+        return None
+    return text[1:].split(maxsplit=1)[0].split("@", 1)[0].lower() if len(text) > 1 else ""
+
+
+def raw_peer_id(peer):
+    return utils.get_peer_id(peer) if isinstance(peer, (raw.types.PeerUser, raw.types.PeerChat, raw.types.PeerChannel)) else None
+
+
+def update_fields(update_type: str, update) -> dict:
+    """Everything filters look at, extracted once per update and shared by all triggers"""
+    if update_type == "deleted_messages":
+        chat = update[0].chat if update else None
+        return {"chat_id": chat.id if chat else None, "user_id": None, "text": None, "command": None, "media": 0}
+
+    if isinstance(update, raw.core.TLObject):
+        if hasattr(update, "channel_id"):
+            chat_id = utils.get_channel_id(update.channel_id)
+        elif hasattr(update, "chat_id"):
+            chat_id = -update.chat_id
+        else:
+            chat_id = raw_peer_id(getattr(update, "peer", None))
+        user_id = getattr(update, "user_id", None) or raw_peer_id(getattr(update, "from_id", None))
+        return {"chat_id": chat_id, "user_id": user_id, "text": None, "command": None, "media": 0}
+
+    # Pyrogram objects: messages, callback / inline queries, member updates, join requests, user statuses
+    message = update if update_type in MESSAGE_UPDATE_TYPES else getattr(update, "message", None)
+    chat = getattr(update, "chat", None) or getattr(message, "chat", None)
+    user = getattr(update, "from_user", None) or getattr(message, "from_user", None)
+    if update_type == "user_status":
+        user = update
+    text = getattr(message, "text", None) or getattr(message, "caption", None)
+    if update_type == "callback_query":
+        text = update.data if isinstance(update.data, str) else None
+    elif update_type in ("inline_query", "chosen_inline_result"):
+        text = update.query
+    text = str(text) if text is not None else None
+    media = getattr(message, "media", None)
+    return {
+        "chat_id": chat.id if chat else None,
+        "user_id": user.id if user else None,
+        "text": text,
+        "command": parse_command(text),
+        "media": MEDIA_TYPE_BITS[media.value] if isinstance(media, enums.MessageMediaType) else 0,
+    }
+
+
+class CompiledFilter:
+    """A trigger's updateTypes and filters, parsed once at registration.
+
+    Raises ValueError for ids that are not integers, unknown types and
+    invalid patterns.
+    """
+
+    def __init__(self, update_types: list, filters: dict):
+        unknown = set(update_types) - set(UPDATE_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown update types: {', '.join(sorted(unknown))}")
+        self.update_types = frozenset(update_types)
+        self.update_mask = 0
+        for update_type in update_types:
+            self.update_mask |= UPDATE_TYPE_BITS[update_type]
+
+        try:
+            self.chat_ids = frozenset(int(chat_id) for chat_id in split_list(filters.get("chatIds")))
+            self.user_ids = frozenset(int(user_id) for user_id in split_list(filters.get("userIds")))
+        except ValueError:
+            raise ValueError("chatIds and userIds must be integers")
+        self.commands = frozenset(command.lstrip("/").lower() for command in split_list(filters.get("commands")))
+        try:
+            self.pattern = re.compile(filters["textPattern"]) if filters.get("textPattern") else None
+        except re.error as e:
+            raise ValueError(f"Invalid textPattern: {e}")
+
+        media_types = split_list(filters.get("mediaTypes"))
+        unknown = set(media_types) - set(MEDIA_TYPE_BITS)
+        if unknown:
+            raise ValueError(f"Unknown media types: {', '.join(sorted(unknown))}")
+        self.media_mask = 0
+        for media_type in media_types:
+            self.media_mask |= MEDIA_TYPE_BITS[media_type]
+
+    def match(self, update_bit: int, fields: dict) -> bool:
+        # Cheapest checks first; the regex runs last and only when everything else passed
+        if not self.update_mask & update_bit:
+            return False
+        if self.media_mask and not self.media_mask & fields["media"]:
+            return False
+        if self.chat_ids and fields["chat_id"] not in self.chat_ids:
+            return False
+        if self.user_ids and fields["user_id"] not in self.user_ids:
+            return False
+        if self.commands and fields["command"] not in self.commands:
+            return False
+        if self.pattern is not None and not self.pattern.search(fields["text"] or ""):
+            return False
+        return True
+
+
+class TriggerIndex:
+    """Triggers indexed by update type and chat id, so an update is only
+    checked against triggers that could match it"""
+
+    def __init__(self):
+        # update type -> triggers without a chat filter / chat id -> triggers for that chat
+        self.any_chat = {update_type: {} for update_type in UPDATE_TYPES}
+        self.by_chat = {update_type: {} for update_type in UPDATE_TYPES}
+
+    def add(self, trigger):
+        for update_type in trigger.filter.update_types:
+            if trigger.filter.chat_ids:
+                for chat_id in trigger.filter.chat_ids:
+                    self.by_chat[update_type].setdefault(chat_id, {})[trigger.id] = trigger
+            else:
+                self.any_chat[update_type][trigger.id] = trigger
+
+    def remove(self, trigger):
+        for update_type in trigger.filter.update_types:
+            if trigger.filter.chat_ids:
+                for chat_id in trigger.filter.chat_ids:
+                    chat_triggers = self.by_chat[update_type].get(chat_id, {})
+                    chat_triggers.pop(trigger.id, None)
+                    if not chat_triggers:
+                        self.by_chat[update_type].pop(chat_id, None)
+            else:
+                self.any_chat[update_type].pop(trigger.id, None)
+
+    def wants(self, update_type: str) -> bool:
+        return bool(self.any_chat[update_type] or self.by_chat[update_type])
+
+    def candidates(self, update_type: str, chat_id):
+        candidates = list(self.any_chat[update_type].values())
+        chat_triggers = self.by_chat[update_type].get(chat_id)
+        if chat_triggers:
+            candidates.extend(chat_triggers.values())
+        return candidates
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+import random
+from collections import deque
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Webhook delivery settings (can be overridden via environment)
+WEBHOOK_TIMEOUT = float(os.environ.get("PYRO_WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_CONNECTIONS = int(os.environ.get("PYRO_WEBHOOK_CONNECTIONS", "8"))
+WEBHOOK_KEEPALIVE = float(os.environ.get("PYRO_WEBHOOK_KEEPALIVE", "60"))
+# Coalescing: up to BATCH_MAX updates per POST, waiting at most LINGER_MS for a batch to fill.
+# With the default linger of 0 only updates that queued up during the previous POST are batched.
+WEBHOOK_BATCH_MAX = int(os.environ.get("PYRO_WEBHOOK_BATCH_MAX", "100"))
+WEBHOOK_LINGER_MS = float(os.environ.get("PYRO_WEBHOOK_LINGER_MS", "0"))
+# Failed POSTs are retried after BACKOFF * 2^n seconds (capped), then dead-lettered
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("PYRO_WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_BACKOFF = float(os.environ.get("PYRO_WEBHOOK_BACKOFF", "1"))
+WEBHOOK_BACKOFF_MAX = float(os.environ.get("PYRO_WEBHOOK_BACKOFF_MAX", "300"))
+# Per-trigger in-memory queue bound and what to do when it is full
+TRIGGER_QUEUE_MAX = int(os.environ.get("PYRO_TRIGGER_QUEUE_MAX", "10000"))
+TRIGGER_OVERFLOW = os.environ.get("PYRO_TRIGGER_OVERFLOW", "spill")
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+
+def serialize_update(update):
+    """JSON-compatible form of a Pyrogram object, raw TL object or list of them"""
+    if isinstance(update, list):
+        return [serialize_update(item) for item in update]
+    return json.loads(str(update))
+
+
+class WebhookSessions:
+    """One keep-alive HTTP session per webhook host (scheme, host, port)"""
+
+    def __init__(self, connections=WEBHOOK_CONNECTIONS, keepalive=WEBHOOK_KEEPALIVE, timeout=WEBHOOK_TIMEOUT):
+        self.connections = connections
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.sessions = {}
+
+    def get(self, url: str) -> aiohttp.ClientSession:
+        parts = urlsplit(url)
+        host = (parts.scheme, parts.hostname, parts.port)
+        session = self.sessions.get(host)
+        if session is None or session.closed:
+            session = self.sessions[host] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=self.keepalive),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return session
+
+    async def post(self, url: str, body: bytes, headers: dict):
+        async with self.get(url).post(url, data=body, headers=headers) as response:
+            await response.read()
+            if response.status >= 400:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history, status=response.status, message=response.reason
+                )
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+
+def webhook_headers(secret: str = None) -> dict:
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Webhook-Secret"] = secret
+    return headers
+
+
+class TriggerDelivery:
+    """Delivers one trigger's payloads in order, one POST at a time.
+
+    With ``batch_max`` above 1 the POST body is a JSON array of up to
+    ``batch_max`` payloads; the first payload of a batch waits up to
+    ``linger_ms`` for more to arrive.
+
+    Payloads are recorded in the ``store`` outbox until delivered. A failed
+    POST is retried with exponential backoff, holding back later payloads
+    so the order is kept, and after ``WEBHOOK_MAX_ATTEMPTS`` its payloads
+    are dead-lettered.
+
+    At most ``queue_max`` payloads are held in memory. Beyond that the
+    ``overflow`` policy applies: ``block`` makes put() wait for room,
+    ``drop_oldest`` discards the oldest queued payload and ``spill`` leaves
+    new payloads in the outbox only, reading them back as the queue drains.
+    """
+
+    def __init__(self, trigger, sessions: WebhookSessions, store, batch_max=WEBHOOK_BATCH_MAX, linger_ms=WEBHOOK_LINGER_MS,
+                 queue_max=TRIGGER_QUEUE_MAX, overflow=TRIGGER_OVERFLOW):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of: {', '.join(OVERFLOW_POLICIES)}")
+        self.trigger = trigger
+        self.sessions = sessions
+        self.store = store
+        self.batch_max = max(batch_max, 1)
+        self.linger = linger_ms / 1000
+        self.queue_max = max(queue_max, 1)
+        self.overflow = overflow
+        self.pending = deque()
+        self.ready = asyncio.Event()
+        self.full = asyncio.Event()
+        self.space = asyncio.Event()
+        self.task = None
+        self.sending = []
+        # Seq of the newest payload held in memory; spilled payloads all come after it
+        self.last_seq = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.posts = 0
+        self.retries = 0
+        self.dead_lettered = 0
+
+    async def put(self, payload: dict):
+        await self.put_json(json.dumps(payload))
+
+    async def put_json(self, body: str):
+        if self.overflow == "spill" and (self.spilled or len(self.pending) >= self.queue_max):
+            self.store.add(self.trigger, body)
+            self.spilled += 1
+        else:
+            while len(self.pending) >= self.queue_max:
+                if self.overflow == "block":
+                    self.space.clear()
+                    await self.space.wait()
+                else:
+                    seq, _ = self.pending.popleft()
+                    self.store.delete([seq])
+                    self.dropped += 1
+            self.last_seq = self.store.add(self.trigger, body)
+            self.pending.append((self.last_seq, body))
+        self.ready.set()
+        if len(self.pending) + self.spilled >= self.batch_max:
+            self.full.set()
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def unspill(self):
+        """Move spilled payloads back into memory, oldest first"""
+        room = self.queue_max - len(self.pending)
+        if room <= 0:
+            return
+        self.store.flush()
+        rows = self.store.load(self.trigger.id, self.last_seq, room)
+        self.pending.extend(rows)
+        # Nothing left to load means the count drifted (e.g. rows dropped elsewhere): resync
+        self.spilled = max(self.spilled - len(rows), 0) if rows else 0
+        if rows:
+            self.last_seq = rows[-1][0]
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            if self.linger and len(self.pending) + self.spilled < self.batch_max:
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.linger)
+                except asyncio.TimeoutError:
+                    pass
+            if self.spilled and len(self.pending) < min(self.batch_max, self.queue_max):
+                self.unspill()
+            batch = [self.pending.popleft() for _ in range(min(self.batch_max, len(self.pending)))]
+            self.space.set()
+            if not self.pending and not self.spilled:
+                self.ready.clear()
+            if len(self.pending) + self.spilled < self.batch_max:
+                self.full.clear()
+            if batch:
+                await self.send(batch)
+
+    async def send(self, batch: list):
+        trigger = self.trigger
+        seqs = [seq for seq, _ in batch]
+        # Payloads are already JSON, so the batch body is just joined
+        body = ("[" + ",".join(body for _, body in batch) + "]" if self.batch_max > 1 else batch[0][1]).encode()
+        self.sending = seqs
+        attempts = 0
+        while True:
+            try:
+                await self.sessions.post(trigger.webhook_url, body, webhook_headers(trigger.secret))
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                attempts += 1
+                trigger.failed += len(batch)
+                trigger.last_error = str(e) or e.__class__.__name__
+                if attempts >= WEBHOOK_MAX_ATTEMPTS:
+                    self.store.dead_letter(seqs, attempts, trigger.last_error)
+                    self.dead_lettered += len(batch)
+                    self.sending = []
+                    return
+                self.retries += 1
+                delay = min(WEBHOOK_BACKOFF * 2 ** (attempts - 1), WEBHOOK_BACKOFF_MAX)
+                await asyncio.sleep(delay * random.uniform(0.5, 1))
+        self.store.delete(seqs)
+        self.sending = []
+        trigger.delivered += len(batch)
+        self.posts += 1
+
+    async def close(self):
+        """Stop delivering; payloads not delivered yet are dropped from the outbox"""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.store.delete(self.sending + [seq for seq, _ in self.pending])
+        if self.spilled:
+            self.store.flush()
+            self.store.drop_after(self.trigger.id, self.last_seq)
+        self.sending = []
+        self.pending.clear()
+        self.spilled = 0
+
+    def stats(self):
+        return {
+            "batch_max": self.batch_max,
+            "posts": self.posts,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "queue_max": self.queue_max,
+            "overflow": self.overflow,
+            "depth": len(self.pending) + self.spilled,
+            "in_memory": len(self.pending),
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+        }